@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+
+"""Benchmark the scripts of this collection against a fake Github API.
+
+Every script runs in a fresh process, in a scratch copy of this collection,
+against a local fake_github_server serving synthetic (or recorded) data.
+Each script is run twice: "cold" with an empty data store and response
+cache, then "warm", reusing the data of the cold run. Wall time, number of
+requests, transferred bytes, peak memory and the per-phase numbers of
+metrics of every run are written to a JSON file, which can be compared
+against an earlier result with --baseline. The "limited" scenario runs
+against a small rate limit with a short window and throttles requests with
+secondary rate limits, to measure the backoff and retry path.
+
+Requires Python3 and a Unix-like OS (for measuring peak memory).
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import argparse
+import datetime
+import tempfile
+from subprocess import Popen, STDOUT
+import fake_github_server
+
+# entry points and their arguments
+SCRIPTS = [('plot_issue_stats', ['--headless']),
+           ('get_merged_prs_since_tag', []),
+           ('get_closed_issues_since_tag', []),
+           ('get_issues_without_labels', []),
+           ('get_unmergeable_pr_percentage', []),
+           ('get_org_members', []),
+           ('get_org_stats', ['--plot'])]
+RUNS = ['cold', 'warm']
+# rate limits of the fake server, per scenario
+SCENARIOS = {'normal': {'rate_limit': 5000, 'rate_window': 3600,
+                        'throttle': 0},
+             'limited': {'rate_limit': 50, 'rate_window': 5,
+                         'throttle': 20}}
+
+
+def make_workdir(directory):
+    """Populate directory with a copy of this collection, ready to run."""
+
+    currentdir = os.path.dirname(os.path.abspath(__file__))
+    for path in glob.glob(os.path.join(currentdir, '*.py')):
+        shutil.copy(path, directory)
+    with open(os.path.join(directory, 'github_token.txt'), 'w') as fp:
+        fp.write('fake-token\n')
+    # answers to prompts, e.g. declining to open URLs in the browser
+    with open(os.path.join(directory, 'answers.txt'), 'w') as fp:
+        fp.write('n\n' * 10)
+    os.mkdir(os.path.join(directory, 'issue_stats_autosave'))
+
+
+def run_script(directory, script, args, server):
+    """Run a script once, return a dict of measurements."""
+
+    metrics_file = os.path.join(directory, 'metrics.json')
+    if os.path.exists(metrics_file):
+        os.remove(metrics_file)
+    env = dict(os.environ, GITHUB_API_URL=server.base, MPLBACKEND='Agg',
+               GITHUB_METRICS_FILE=metrics_file)
+    server.reset_stats()
+    with open(os.path.join(directory, 'answers.txt')) as answers, \
+            open(os.path.join(directory, script + '.log'), 'a') as log:
+        start = time.time()
+        process = Popen([sys.executable, script + '.py'] + args,
+                        cwd=directory, env=env, stdin=answers, stdout=log,
+                        stderr=STDOUT)
+        # wait4 also reports the resource usage of the finished process
+        _, status, usage = os.wait4(process.pid, 0)
+        wall_time = time.time() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    peak_rss = usage.ru_maxrss  # kilobytes on Linux, bytes on macOS
+    if sys.platform == 'darwin':
+        peak_rss //= 1024
+    # numbers per phase, as seen by the script itself
+    phases = {}
+    if os.path.exists(metrics_file):
+        with open(metrics_file) as fp:
+            phases = json.load(fp)['phases']
+    return {'returncode': process.returncode,
+            'wall_time': round(wall_time, 3),
+            'requests': server.stats['requests'],
+            'not_modified': server.stats['not_modified'],
+            'rate_limited': server.stats['rate_limited'],
+            'bytes': server.stats['bytes'],
+            'peak_rss_kb': peak_rss,
+            'phases': phases}
+
+
+def compare(results, baseline):
+    """Print the change of each measurement relative to a baseline."""
+
+    old = {(r['script'], r['run']): r for r in baseline['results']}
+    print('\nChange relative to baseline from ' + baseline['date'] + ':')
+    for r in results:
+        b = old.get((r['script'], r['run']))
+        if b is None:
+            continue
+        changes = []
+        for key in ('wall_time', 'requests', 'bytes', 'peak_rss_kb'):
+            if b[key]:
+                changes.append(key + ' %+.0f%%' %
+                               (100.0 * (r[key] - b[key]) / b[key]))
+        print('{:<32}{:<6}'.format(r['script'], r['run']) +
+              ', '.join(changes))
+
+
+def main(args):
+    """Main function of benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('scripts', nargs='*',
+                        help='scripts to run (default: all)')
+    parser.add_argument('--issues', type=int, default=50000,
+                        help='number of synthetic issues, of which 10%% '
+                        'are PRs')
+    parser.add_argument('--commits', type=int, default=20000)
+    parser.add_argument('--tags', type=int, default=300)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds added to every response')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS),
+                        default='normal',
+                        help='rate limits of the server (default: normal)')
+    parser.add_argument('--rate-limit', type=int,
+                        help='requests per window and resource, 0 for no '
+                        'rate limit headers (overrides the scenario)')
+    parser.add_argument('--rate-window', type=int, metavar='SECONDS',
+                        help='overrides the scenario')
+    parser.add_argument('--throttle', type=int, metavar='N',
+                        help='reject every N-th request with a secondary '
+                        'rate limit (overrides the scenario)')
+    parser.add_argument('--fixture', help='serve a recorded JSON fixture, '
+                        'see fake_github_server --record')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help='earlier results to compare to')
+    options = parser.parse_args(args[1:])
+
+    scripts = [s for s in SCRIPTS
+               if not options.scripts or s[0] in options.scripts]
+    if options.fixture:
+        with open(options.fixture) as fp:
+            fixture = json.load(fp)
+        parameters = {'fixture': options.fixture}
+    else:
+        fixture = fake_github_server.synthetic_fixture(
+            nr_issues=options.issues, nr_commits=options.commits,
+            nr_tags=options.tags)
+        parameters = {'issues': options.issues, 'commits': options.commits,
+                      'tags': options.tags}
+    limits = dict(SCENARIOS[options.scenario])
+    for key in limits:
+        if getattr(options, key) is not None:
+            limits[key] = getattr(options, key)
+    parameters.update(limits, latency=options.latency,
+                      scenario=options.scenario)
+
+    results = []
+    server = fake_github_server.FakeGithubServer(
+        fixture, latency=options.latency, **limits)
+    with server:
+        for script, script_args in scripts:
+            with tempfile.TemporaryDirectory() as directory:
+                make_workdir(directory)
+                for run in RUNS:
+                    result = run_script(directory, script, script_args,
+                                        server)
+                    result.update(script=script, args=script_args, run=run)
+                    results.append(result)
+                    print('{:<32}{:<6}'.format(script, run) +
+                          '%8.2fs %6d requests (%d not modified, '
+                          '%d rate limited) %8.1f MB, peak memory %6.1f MB'
+                          % (result['wall_time'], result['requests'],
+                             result['not_modified'], result['rate_limited'],
+                             result['bytes'] / 1e6,
+                             result['peak_rss_kb'] / 1024.0))
+                    if result['returncode']:
+                        with open(os.path.join(directory,
+                                               script + '.log')) as log:
+                            print(log.read()[-2000:])
+
+    with open(options.output, 'w') as fp:
+        json.dump({'date': datetime.datetime.utcnow().isoformat(),
+                   'python': sys.version.split()[0],
+                   'parameters': parameters,
+                   'results': results}, fp, indent=1)
+    print('Results written to ' + options.output)
+    if options.baseline:
+        with open(options.baseline) as fp:
+            compare(results, json.load(fp))
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,620 @@
+#!/usr/bin/env python3
+
+"""
+A local stand-in for the Github API, serving recorded or synthetic data.
+
+Only the endpoints and fields used by the scripts in this collection are
+implemented. Listings are paginated with Link headers like the real API,
+responses carry ETags (and answer conditional requests with 304) and rate
+limit headers, and latency can be injected. Requests beyond the rate limit
+are answered with 403 until the window resets, and every n-th request can
+be rejected with a secondary rate limit (throttle). All requests are
+counted, see FakeGithubServer.stats.
+
+Can be run on its own, e.g. to point scripts at it via GITHUB_API_URL:
+    python3 fake_github_server.py --port 8000 --issues 50000
+    GITHUB_API_URL=http://127.0.0.1:8000 python3 get_merged_prs_since_tag.py
+
+See benchmark.py for running all scripts against it.
+
+Requires Python3
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import datetime
+import threading
+from urllib.parse import urlparse, parse_qs, urlencode
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Placeholder for the server address in fixture URLs
+BASE = 'http://BASE'
+_DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+_NO_STATS = {'requests': 0, 'not_modified': 0, 'rate_limited': 0, 'bytes': 0}
+
+
+def _date(dt):
+    return dt.strftime(_DATE_FORMAT) if dt else None
+
+
+def _resource(path):
+    """Return the Github rate limit resource a request path counts against."""
+
+    if path == '/graphql':
+        return 'graphql'
+    return 'search' if path.startswith('/search/') else 'core'
+
+
+def _user(login):
+    return {'login': login, 'type': 'User', 'url': BASE + '/users/' + login}
+
+
+def synthetic_fixture(owner='openframeworks', repos=('openFrameworks',),
+                      nr_issues=50000, pr_fraction=0.1, nr_tags=300,
+                      nr_commits=20000, nr_users=500, nr_teams=5, seed=0):
+    """Return a fixture of random, but reproducible, repository data."""
+
+    rng = random.Random(seed)
+    start = datetime.datetime(2009, 1, 1)
+    span = (datetime.datetime(2020, 1, 1) - start).total_seconds()
+    logins = ['user%d' % i for i in range(nr_users)]
+    label_names = ['bug', 'feature', 'documentation', 'core', 'addons',
+                   'windows', 'linux', 'osx', 'ios', 'android']
+    fixture = {'owner': owner,
+               'users': {l: rng.choice([None, 'Name of ' + l])
+                         for l in logins},
+               'teams': [{'id': i + 1, 'name': 'team%d' % i,
+                          'members': rng.sample(logins, 20)}
+                         for i in range(nr_teams)],
+               'repos': {}}
+    for name in repos:
+        url = BASE + '/repos/' + owner + '/' + name
+        issues = []
+        pulls = {}
+        closed_by = {}
+        for number in range(1, nr_issues + 1):
+            created = start + datetime.timedelta(seconds=span * number /
+                                                 (nr_issues + 1))
+            closed = None
+            if rng.random() < 0.8:
+                closed = created + datetime.timedelta(
+                    hours=rng.expovariate(1 / 500.0))
+            updated = max(created, closed or created) + datetime.timedelta(
+                hours=rng.random() * 100)
+            issue = {'number': number,
+                     'id': number,
+                     'url': url + '/issues/' + str(number),
+                     'html_url': ('https://github.com/' + owner + '/' + name +
+                                  '/issues/' + str(number)),
+                     'title': 'Issue number %d' % number,
+                     'state': 'closed' if closed else 'open',
+                     'user': _user(rng.choice(logins)),
+                     'labels': [{'name': l, 'color': 'ededed'}
+                                for l in rng.sample(label_names,
+                                                    rng.choice([0, 0, 1, 2]))],
+                     'comments': rng.randrange(10),
+                     'created_at': _date(created),
+                     'updated_at': _date(updated),
+                     'closed_at': _date(closed)}
+            if closed:
+                closed_by[number] = rng.choice(logins)
+            if rng.random() < pr_fraction:
+                merged = closed if closed and rng.random() < 0.7 else None
+                issue['pull_request'] = {'url': url + '/pulls/' + str(number),
+                                         'merged_at': _date(merged)}
+                pulls[number] = {'merged_at': _date(merged),
+                                 'base_ref': 'master',
+                                 'mergeable': rng.random() < 0.7}
+            issues.append(issue)
+        commits = []
+        parent = None
+        for i in range(nr_commits):
+            date = start + datetime.timedelta(seconds=span * i / nr_commits)
+            sha = hashlib.sha1((name + str(i)).encode()).hexdigest()
+            commits.append({'sha': sha, 'date': _date(date),
+                            'parents': [parent] if parent else []})
+            parent = sha
+        commits.reverse()  # newest first, like the API
+        tag_commits = sorted(rng.sample(range(len(commits)),
+                                        min(nr_tags, len(commits))))
+        fixture['repos'][name] = {
+            'issues': issues,
+            'pulls': pulls,
+            'closed_by': closed_by,
+            'labels': [{'name': l, 'color': 'ededed'} for l in label_names],
+            'tags': [{'name': '%d.%d.%d' % (i // 100, i // 10 % 10, i % 10),
+                      'sha': commits[c]['sha'],
+                      'date': commits[c]['date']}
+                     for i, c in enumerate(reversed(tag_commits))],
+            'commits': commits}
+    return fixture
+
+
+def record_fixture(user, repos, nr_commits=1000):
+    """Return a fixture recorded from the real Github API.
+
+    Needs a token, see github_tools.get_github_instance.
+    """
+
+    import github_tools
+    gh_instance = github_tools.get_github_instance()
+    fixture = {'owner': user, 'users': {}, 'teams': [], 'repos': {}}
+    for name in repos:
+        repo = gh_instance.get_user(user).get_repo(name)
+        with github_tools.repo_store.RepoStore(':memory:') as store:
+            tags = github_tools.update_tag_index(repo, store)
+        issues = [i.raw_data for i in
+                  github_tools.fetch_all(repo.get_issues(state='all'))]
+        pulls = {p.number: {'merged_at': _date(p.merged_at),
+                            'base_ref': p.base.ref,
+                            'mergeable': None}
+                 for p in github_tools.fetch_all(repo.get_pulls(state='all'))}
+        commits = []
+        for c in repo.get_commits()[:nr_commits]:
+            commits.append({'sha': c.sha,
+                            'date': _date(c.commit.committer.date),
+                            'parents': [p.sha for p in c.parents]})
+        fixture['repos'][name] = {
+            'issues': issues,
+            'pulls': pulls,
+            'closed_by': {},
+            'labels': [{'name': l.name, 'color': l.color}
+                       for l in github_tools.fetch_all(repo.get_labels())],
+            'tags': [{'name': t['name'], 'sha': t['sha'],
+                      'date': _date(t['date'])} for t in tags],
+            'commits': commits}
+    # point the recorded URLs to the fake server
+    return json.loads(json.dumps(fixture).replace('https://api.github.com',
+                                                  BASE))
+
+
+class _Repo(object):
+    """Fixture data of one repo, with precomputed orderings."""
+
+    def __init__(self, owner, name, data):
+        self.owner = owner
+        self.name = name
+        self.data = data
+        # JSON object keys are strings
+        data['pulls'] = {int(k): v for k, v in data['pulls'].items()}
+        data['closed_by'] = {int(k): v for k, v in data['closed_by'].items()}
+        self.url = BASE + '/repos/' + owner + '/' + name
+        self.issues = sorted(data['issues'], key=lambda i: i['number'])
+        self.by_number = {i['number']: i for i in self.issues}
+        self.by_updated = sorted(self.issues, key=lambda i: i['updated_at'])
+        self.commits = data['commits']
+
+    def repo_json(self):
+        return {'name': self.name,
+                'full_name': self.owner + '/' + self.name,
+                'owner': _user(self.owner),
+                'url': self.url,
+                'html_url': 'https://github.com/' + self.owner + '/' +
+                            self.name,
+                'clone_url': 'https://github.com/' + self.owner + '/' +
+                             self.name + '.git',
+                'open_issues': sum(1 for i in self.issues
+                                   if i['state'] == 'open'),
+                'updated_at': max(i['updated_at'] for i in self.issues),
+                'pushed_at': self.commits[0]['date'] if self.commits else None}
+
+    def pull_json(self, issue, full=False):
+        extra = self.data['pulls'].get(issue['number'], {})
+        pull = {'number': issue['number'],
+                'id': issue['number'],
+                'url': self.url + '/pulls/' + str(issue['number']),
+                'html_url': issue['html_url'],
+                'title': issue['title'],
+                'state': issue['state'],
+                'user': issue['user'],
+                'created_at': issue['created_at'],
+                'updated_at': issue['updated_at'],
+                'closed_at': issue['closed_at'],
+                'merged_at': extra.get('merged_at'),
+                'base': {'ref': extra.get('base_ref', 'master'),
+                         'label': self.owner + ':master'},
+                'head': {'ref': 'pr%d' % issue['number']}}
+        if full:
+            pull['merged'] = extra.get('merged_at') is not None
+            pull['mergeable'] = (extra.get('mergeable')
+                                 if issue['state'] == 'open' else None)
+        return pull
+
+    def commit_json(self, commit):
+        return {'sha': commit['sha'],
+                'url': self.url + '/commits/' + commit['sha'],
+                'commit': {'author': {'date': commit['date']},
+                           'committer': {'date': commit['date']}},
+                'parents': [{'sha': p} for p in commit['parents']]}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serve the fixture of the owning FakeGithubServer."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        return
+
+    # -------------------------------------------------------------------------
+    def do_GET(self):
+        self.server.fake.delay()
+        url = urlparse(self.path)
+        if self._rate_limited(url.path):
+            return
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            result = self.server.fake.get(url.path, query)
+        except KeyError:
+            result = None
+        if result is None:
+            self._send(404, {'message': 'Not Found'})
+        elif isinstance(result, tuple):
+            self._send_page(url.path, query, *result)
+        else:
+            self._send(200, result)
+
+    def do_POST(self):
+        self.server.fake.delay()
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length).decode() or '{}')
+        if self._rate_limited(urlparse(self.path).path):
+            return
+        if urlparse(self.path).path != '/graphql':
+            self._send(404, {'message': 'Not Found'})
+            return
+        self._send(200, self.server.fake.graphql(request['query'],
+                                                 request.get('variables')
+                                                 or {}))
+
+    def _rate_limited(self, path):
+        """Reject a request beyond the rate limits, return True if it was."""
+
+        self._resource = _resource(path)
+        rejection = self.server.fake.check_rate_limits(self._resource)
+        if rejection is None:
+            return False
+        self._send(*rejection)
+        return True
+
+    # -------------------------------------------------------------------------
+    def _send_page(self, path, query, items, wrap=None):
+        """Send one page of a listing, with Link headers."""
+
+        per_page = min(int(query.get('per_page', 30)), 100)
+        page = int(query.get('page', 1))
+        if wrap:
+            # like Github, only the first 1000 search results are available
+            if (page - 1) * per_page >= 1000:
+                self._send(422, {'message': 'Only the first 1000 search '
+                                            'results are available'})
+                return
+            items = items[:1000]
+        last = max(-(-len(items) // per_page), 1)
+        body = items[(page - 1) * per_page:page * per_page]
+        if wrap:
+            body = dict(wrap, items=body)
+        links = []
+        for rel, number in (('prev', page - 1), ('next', page + 1),
+                            ('first', 1), ('last', last)):
+            if 1 <= number <= last and (number != page or rel == 'last'):
+                link_query = dict(query, page=number, per_page=per_page)
+                links.append('<' + self.server.fake.base + path + '?' +
+                             urlencode(link_query) + '>; rel="' + rel + '"')
+        self._send(200, body, {'Link': ', '.join(links)})
+
+    def _send(self, status, body, headers=None):
+        fake = self.server.fake
+        data = json.dumps(body).replace(BASE, fake.base).encode()
+        etag = '"' + hashlib.md5(data).hexdigest() + '"'
+        headers = dict(headers or {}, ETag=etag)
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            status, data = 304, b''
+        # like Github, rejected and not modified requests are not counted
+        headers = dict(fake.rate_limit_headers(
+            self._resource, count=status not in (304, 403, 429)), **headers)
+        fake.count(status, len(data))  # before the client sees the response
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeGithubServer(object):
+    """A Github API stand-in, serving a fixture on a local port."""
+
+    def __init__(self, fixture, port=0, latency=0.0, rate_limit=5000,
+                 rate_window=3600, throttle=0):
+        self.fixture = fixture
+        self.owner = fixture['owner']
+        self.repos = {name: _Repo(self.owner, name, data)
+                      for name, data in fixture['repos'].items()}
+        self.latency = latency
+        # requests per window and resource, 0 for no rate limit at all
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        # every throttle-th request hits a secondary rate limit, if set
+        self.throttle = throttle
+        self._limits = {}  # resource -> [remaining, reset]
+        self._nr_checked = 0
+        self._lock = threading.Lock()
+        self.stats = dict(_NO_STATS)
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self.base = 'http://127.0.0.1:' + str(self._server.server_address[1])
+        self._thread = None
+
+    def start(self):
+        """Serve in a background thread, return the base URL."""
+
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self.base
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = dict(_NO_STATS)
+
+    # -------------------------------------------------------------------------
+    def delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def count(self, status, nr_bytes):
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['bytes'] += nr_bytes
+            if status == 304:
+                self.stats['not_modified'] += 1
+            elif status in (403, 429):
+                self.stats['rate_limited'] += 1
+
+    def _window(self, resource):
+        """Return the [remaining, reset] state of a resource's window."""
+
+        now = time.time()
+        state = self._limits.get(resource)
+        if state is None or state[1] <= now:
+            state = self._limits[resource] = [self.rate_limit,
+                                              int(now) + self.rate_window]
+        return state
+
+    def check_rate_limits(self, resource):
+        """Return the (status, body, headers) of a rejection, or None."""
+
+        with self._lock:
+            self._nr_checked += 1
+            if self.throttle and self._nr_checked % self.throttle == 0:
+                return (403, {'message': 'You have exceeded a secondary '
+                                         'rate limit. Please wait a few '
+                                         'minutes before you try again.'},
+                        {'Retry-After': '1'})
+            if self.rate_limit and self._window(resource)[0] == 0:
+                return (403, {'message': 'API rate limit exceeded'}, {})
+        return None
+
+    def rate_limit_headers(self, resource, count=True):
+        if not self.rate_limit:
+            return {}
+        with self._lock:
+            state = self._window(resource)
+            if count:
+                state[0] = max(state[0] - 1, 0)
+            return {'X-RateLimit-Limit': str(self.rate_limit),
+                    'X-RateLimit-Remaining': str(state[0]),
+                    'X-RateLimit-Reset': str(state[1]),
+                    'X-RateLimit-Resource': resource}
+
+    # -------------------------------------------------------------------------
+    def get(self, path, query):
+        """Return a JSON result, a (list, wrap) tuple for listings, or None."""
+
+        parts = path.strip('/').split('/')
+        if parts[0] == 'users' and len(parts) == 2:
+            return dict(_user(parts[1]),
+                        name=self.fixture['users'].get(parts[1]))
+        if parts[0] == 'orgs' and len(parts) == 2:
+            return {'login': parts[1], 'url': BASE + '/orgs/' + parts[1]}
+        if parts[0] == 'orgs' and parts[2] == 'teams':
+            return ([{'id': t['id'], 'name': t['name'],
+                      'url': BASE + '/teams/' + str(t['id'])}
+                     for t in self.fixture['teams']],)
+        if parts[0] == 'orgs' and parts[2] == 'repos':
+            return ([r.repo_json() for r in self.repos.values()],)
+        if parts[0] == 'teams' and parts[2] == 'members':
+            team = [t for t in self.fixture['teams']
+                    if t['id'] == int(parts[1])][0]
+            return ([_user(l) for l in team['members']],)
+        if parts[0] == 'search' and parts[1] == 'issues':
+            return self._search(query['q'])
+        if parts[0] == 'repos':
+            return self._get_repo(self.repos[parts[2]], parts[3:], query)
+        return None
+
+    def _get_repo(self, repo, parts, query):
+        if not parts:
+            return repo.repo_json()
+        if parts[0] == 'issues' and len(parts) == 1:
+            return (self._filter_issues(repo, query),)
+        if parts[0] == 'issues' and parts[1] == 'events':
+            return (self._closed_events(repo),)
+        if parts[0] == 'issues':
+            number = int(parts[1])
+            issue = dict(repo.by_number[number])
+            closer = repo.data['closed_by'].get(number)
+            issue['closed_by'] = _user(closer) if closer else None
+            return issue
+        if parts[0] == 'pulls' and len(parts) == 1:
+            issues = [i for i in self._filter_issues(repo, query)
+                      if 'pull_request' in i]
+            return ([repo.pull_json(i) for i in issues],)
+        if parts[0] == 'pulls':
+            return repo.pull_json(repo.by_number[int(parts[1])], full=True)
+        if parts[0] == 'labels':
+            return (repo.data['labels'],)
+        if parts[0] == 'tags':
+            return ([{'name': t['name'],
+                      'commit': {'sha': t['sha'],
+                                 'url': repo.url + '/commits/' + t['sha']}}
+                     for t in reversed(repo.data['tags'])],)
+        if parts[0] == 'branches':
+            return {'name': parts[1],
+                    'commit': repo.commit_json(repo.commits[0])}
+        if parts[0] == 'commits' and len(parts) == 1:
+            commits = repo.commits
+            if 'since' in query:
+                commits = [c for c in commits if c['date'] >= query['since']]
+            return ([repo.commit_json(c) for c in commits],)
+        return None
+
+    @staticmethod
+    def _filter_issues(repo, query):
+        state = query.get('state', 'open')
+        since = query.get('since')
+        if query.get('sort') == 'updated':
+            issues = repo.by_updated
+        else:
+            issues = repo.issues
+        if query.get('direction', 'desc') == 'desc':
+            issues = issues[::-1]
+        return [i for i in issues
+                if (state == 'all' or i['state'] == state) and
+                (since is None or i['updated_at'] >= since)]
+
+    @staticmethod
+    def _closed_events(repo):
+        events = [{'id': i['number'], 'event': 'closed',
+                   'actor': _user(repo.data['closed_by'][i['number']]),
+                   'created_at': i['closed_at'], 'issue': i}
+                  for i in repo.issues
+                  if i['number'] in repo.data['closed_by']]
+        events.sort(key=lambda e: e['created_at'], reverse=True)
+        return events
+
+    def _search(self, q):
+        """Support the qualifiers repo:, is:, no:label and created:<."""
+
+        terms = q.split()
+        repo = self.repos[[t for t in terms
+                           if t.startswith('repo:')][0].split('/')[1]]
+        issues = repo.issues[::-1]
+        for t in terms:
+            if t in ('is:open', 'is:closed', 'state:open', 'state:closed'):
+                issues = [i for i in issues if i['state'] == t.split(':')[1]]
+            elif t in ('is:issue', 'type:issue'):
+                issues = [i for i in issues if 'pull_request' not in i]
+            elif t in ('is:pr', 'type:pr'):
+                issues = [i for i in issues if 'pull_request' in i]
+            elif t == 'no:label':
+                issues = [i for i in issues if not i['labels']]
+            elif t.startswith('created:<'):
+                issues = [i for i in issues
+                          if i['created_at'][:10] < t[len('created:<'):]]
+        return issues, {'total_count': len(issues),
+                        'incomplete_results': False}
+
+    # -------------------------------------------------------------------------
+    def graphql(self, query, variables):
+        """Answer the GraphQL queries used by github_tools."""
+
+        if 'refs(' in query:
+            return self._graphql_tags(variables)
+        if 'history(' in query:
+            return self._graphql_history(variables)
+        if 'user(login' in query:
+            return {'data': {alias: {'name': self.fixture['users'].get(login)}
+                             for alias, login in
+                             re.findall(r'(\w+): user\(login: "([^"]+)"\)',
+                                        query)}}
+        return {'errors': [{'message': 'Query not supported by fake server'}]}
+
+    def _graphql_tags(self, variables):
+        tags = list(reversed(self.repos[variables['name']].data['tags']))
+        start = int(variables.get('cursor') or 0)
+        nodes = [{'name': t['name'],
+                  'target': {'oid': t['sha'], 'committedDate': t['date']}}
+                 for t in tags[start:start + 100]]
+        return {'data': {'repository': {'refs': {
+            'pageInfo': {'hasNextPage': start + 100 < len(tags),
+                         'endCursor': str(start + 100)},
+            'nodes': nodes}}}}
+
+    def _graphql_history(self, variables):
+        commits = self.repos[variables['name']].commits
+        start = int(variables.get('cursor') or 0)
+        nodes = [{'oid': c['sha'], 'authoredDate': c['date'],
+                  'committedDate': c['date'],
+                  'parents': {'nodes': [{'oid': p} for p in c['parents']]}}
+                 for c in commits[start:start + 100]]
+        return {'data': {'repository': {'ref': {'target': {'history': {
+            'pageInfo': {'hasNextPage': start + 100 < len(commits),
+                         'endCursor': str(start + 100)},
+            'nodes': nodes}}}}}}
+
+
+def main(args):
+    """Main function of fake_github_server"""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--issues', type=int, default=50000)
+    parser.add_argument('--commits', type=int, default=20000)
+    parser.add_argument('--tags', type=int, default=300)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds added to every response')
+    parser.add_argument('--rate-limit', type=int, default=5000,
+                        help='requests per window and resource, 0 for no '
+                        'rate limit headers')
+    parser.add_argument('--rate-window', type=int, default=3600,
+                        metavar='SECONDS')
+    parser.add_argument('--throttle', type=int, default=0, metavar='N',
+                        help='reject every N-th request with a secondary '
+                        'rate limit')
+    parser.add_argument('--fixture', help='serve a recorded JSON fixture')
+    parser.add_argument('--record', metavar='FILE',
+                        help='record a fixture from the real API and exit')
+    options = parser.parse_args(args[1:])
+    if options.record:
+        with open(options.record, 'w') as fp:
+            json.dump(record_fixture('openframeworks', ['openFrameworks']), fp)
+        return
+    if options.fixture:
+        with open(options.fixture) as fp:
+            fixture = json.load(fp)
+    else:
+        fixture = synthetic_fixture(nr_issues=options.issues,
+                                    nr_commits=options.commits,
+                                    nr_tags=options.tags)
+    server = FakeGithubServer(fixture, port=options.port,
+                              latency=options.latency,
+                              rate_limit=options.rate_limit,
+                              rate_window=options.rate_window,
+                              throttle=options.throttle)
+    print('Serving fake Github API at ' + server.base)
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -3,6 +3,8 @@
 """Print a list of issues closed since a certain tag.
 
 The tag name can be given as argument. If none was given, choose latest tag.
+Issues are listed by closing date, newest first.
+With --offline, the local mirror is queried without syncing it first.
 """
 
 import github_tools
@@ -11,22 +13,25 @@ import sys
 
 def main(args):
     """Main function for get_closed_issues_since_tag"""
+    offline = '--offline' in args
+    args = [a for a in args if a != '--offline']
     if len(args) == 2:
         tagname = args[1]
     else:
         tagname = ''
-    repo = github_tools.get_repo()
-    tag = github_tools.validate_tagname(repo, tagname)
-    closed_issues = repo.get_issues(state='closed', since=tag['date'])
+    repo, store = github_tools.get_mirror(offline=offline)
+    tag = github_tools.validate_tagname(repo, tagname, store)
+    closed_issues = store.issues(state='closed', closed_after=tag['date'])
     print('nr.  close_time          PR?   closed_by title')
-    for c in closed_issues:
-        if c.closed_at > tag['date']:
-            if c.pull_request:
-                PR = 'wasPR'
-            else:
-                PR = '     '
-            print(c.number, c.closed_at.isoformat(), PR,
-                  str(c.closed_by.login) + '\t', str(c.title))
+    # rows are printed as soon as their closer is known, newest first
+    for c in github_tools.iter_closers(repo, store, closed_issues,
+                                       tag['date']):
+        if c['is_pr']:
+            PR = 'wasPR'
+        else:
+            PR = '     '
+        print(c['number'], c['closed_at'].isoformat(), PR,
+              str(c['closed_by']) + '\t', str(c['title']), flush=True)
 
 
 if __name__ == '__main__':
@@ -1,23 +1,30 @@
 #!/usr/bin/env python3
 
-""" List unlabeled Github issues, optionally open them in a browser."""
+""" List unlabeled Github issues, optionally open them in a browser.
+
+If there is no local mirror yet, Github is searched for unlabeled issues
+instead of fetching all issues.
+With --offline, the local mirror is queried without syncing it first.
+"""
 
 import github_tools
+import issue_query
+import sys
 
 
-def main():
+def main(args):
     """Main function for get_issues_without_labels"""
-    repo = github_tools.get_repo()
+    issues = issue_query.find_issues(offline='--offline' in args,
+                                     state='open', is_pr=False,
+                                     no_label=True)
     list_of_issue_urls = []
-    issues = repo.get_issues(state='open')
     print('List of open issues without labels:')
     for i in issues:
-        if (i.labels == []) and (i.pull_request is None):
-            list_of_issue_urls.append(i.html_url)
-            print(i.number)
+        list_of_issue_urls.append(i['html_url'])
+        print(i['number'])
 
     print('\n')
     github_tools.open_in_browser(list_of_issue_urls)
 
 if __name__ == '__main__':
-    main()
+    main(sys.argv)
@@ -3,31 +3,68 @@
 """Get a markdown-formatted list of PRs merged since a certain tag.
 
 The tag name can be given as argument. If none was given, choose latest tag.
+The local mirror is queried if it exists (see get_mirror), otherwise the PRs
+updated since the tag are listed from Github.
+With --offline, the local mirror is queried without syncing it first.
 """
 
-# TODO: Why is this script so bandwidth-intensive?
-
 import github_tools
+import repo_store
 import sys
 
 
+def merged_prs_listed_since(repo, date):
+    """Return a list of dicts of the PRs merged after a date.
+
+    PRs are listed by their last update, newest first, so the listing stops
+    at the first PR not updated since the date. The listing payload already
+    contains merge date and author, so no requests per PR are needed.
+    """
+
+    results = []
+    for p in repo.get_pulls(state='closed', sort='updated', direction='desc'):
+        if repo_store.naive_utc(p.updated_at) < date:
+            break
+        if p.merged_at and repo_store.naive_utc(p.merged_at) > date:
+            results.append({'login': p.user.login,
+                            'number': p.number,
+                            'url': p.html_url,
+                            'title': p.title})
+    results.sort(key=lambda r: r['number'], reverse=True)
+    return results
+
+
+def merged_prs_since(store, date):
+    """Return a list of dicts of the PRs merged after a date, from a mirror."""
+
+    return [{'login': p['user'],
+             'number': p['number'],
+             'url': p['html_url'],
+             'title': p['title']}
+            for p in reversed(store.issues(is_pr=True, merged_after=date))]
+
+
 def main(args):
     """Main function of get_merged_prs_since_tag"""
+    offline = '--offline' in args
+    args = [a for a in args if a != '--offline']
     if len(args) == 2:
         tagname = args[1]
     else:
         tagname = ''
-    repo = github_tools.get_repo()
-    tag = github_tools.validate_tagname(repo, tagname)
-    print('Fetching data...\n\n')
-    pulls = repo.get_pulls(state='closed')
-    results = []
-    for p in pulls:
-        if (p.closed_at > tag['date']) and p.merged:
-            results.append({'login': p.user.login,
-                            'number': p.number,
-                            'url': p.html_url,
-                            'title': p.title})
+    if offline or github_tools.has_mirror():
+        repo, store = github_tools.get_mirror(offline=offline)
+        tag = github_tools.validate_tagname(repo, tagname, store)
+        print('\n')
+        results = merged_prs_since(store, tag['date'])
+    else:
+        repo = github_tools.get_repo()
+        tag = github_tools.validate_tagname(repo, tagname)
+        print('Fetching PRs updated since the tag...\n\n')
+        results = merged_prs_listed_since(repo, tag['date'])
+    if not results:
+        print('No PRs merged since ' + tag['name'])
+        return
 
     user_maxlength = max([len(entry['login']) for entry in results])
     format_string = '{:<' + str(user_maxlength) + '}'
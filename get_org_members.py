@@ -3,25 +3,37 @@
 """Print a list of organization team members. Token needs read:org scope."""
 
 import github_tools
+import sys
+import repo_store
+import metrics
+from concurrent.futures import ThreadPoolExecutor
 
 
-def main():
+def main(args):
     """Main function of get_org_members"""
     gh_instance = github_tools.get_github_instance()
     org = gh_instance.get_organization('openframeworks')
-    teams = org.get_teams()
-    for t in teams:
-        if 'devs' not in t.name:
-            print(t.name + ':')
-            members = t.get_members()
-            for m in members:
-                if m.name:
-                    name = m.name
-                else:
-                    name = ''
-                print('@' + m.login + ' ' + name)
-
-            print('')
+    teams = [t for t in github_tools.fetch_all(org.get_teams())
+             if 'devs' not in t.name]
+    # Member lists are fetched concurrently. Unchanged lists are answered
+    # from the response cache.
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        team_members = list(executor.map(metrics.in_context(
+            lambda t: github_tools.fetch_all(t.get_members())), teams))
+
+    # Names are not part of the member listing, resolve them in bulk, once
+    # per user
+    logins = {m.login for members in team_members for m in members}
+    with repo_store.RepoStore(repo_store.default_path(org.login,
+                                                      None)) as store:
+        names = github_tools.resolve_user_names(org, logins, store)
+
+    for t, members in zip(teams, team_members):
+        print(t.name + ':')
+        for m in members:
+            print('@' + m.login + ' ' + (names[m.login] or ''))
+
+        print('')
 
 if __name__ == '__main__':
-    main()
+    main(sys.argv)
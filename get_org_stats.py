@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+"""Print issue and PR statistics of all repositories of an organization.
+
+All repositories are synced concurrently, each into its own local mirror.
+Repositories unchanged since the last run are not fetched again.
+With --plot, an overview figure of the issues and commits of all
+repositories together is saved to issue_stats_autosave.
+"""
+
+import argparse
+import datetime
+import os
+import sys
+import github_tools
+import plot_issue_stats
+
+TABLE_FORMAT = '{:<24}{:>7}{:>7}{:>9}{:>9}{:>12}{:>11}'
+
+
+def repo_statistics(issues, now):
+    """Return a table row of statistics of a list of issue records."""
+
+    import issue_metrics
+    begin = now - datetime.timedelta(days=365)
+    open_issues = [i for i in issues if i['state'] == 'open']
+    stats = issue_metrics.IssueStats(i for i in issues if not i['is_pr'])
+    time_to_fix = stats.time_to_fix(begin)
+    unlabeled = stats.fraction_unlabeled(begin)
+    return [sum(1 for i in open_issues if not i['is_pr']),
+            sum(1 for i in open_issues if i['is_pr']),
+            time_to_fix['count'] if time_to_fix else 0,
+            sum(1 for i in issues
+                if i['merged_at'] and i['merged_at'] >= begin),
+            '%.1f' % (time_to_fix['mean'].total_seconds() / 86400)
+            if time_to_fix else '-',
+            '%.0f%%' % (100 * unlabeled) if unlabeled is not None else '-']
+
+
+def main(args):
+    """Main function of get_org_stats"""
+    parser = argparse.ArgumentParser(prog=os.path.basename(args[0]),
+                                     description=__doc__)
+    parser.add_argument('org', nargs='?', default='openframeworks')
+    parser.add_argument('--offline', action='store_true',
+                        help='use the local mirrors without syncing them')
+    parser.add_argument('--force', action='store_true',
+                        help='sync all repositories, even if unchanged')
+    parser.add_argument('--plot', action='store_true',
+                        help='save an overview figure of all repositories')
+    options = parser.parse_args(args[1:])
+
+    mirrors = github_tools.sync_org_mirrors(options.org,
+                                            offline=options.offline,
+                                            commits=options.plot,
+                                            force=options.force)
+    now = datetime.datetime.utcnow()
+    print('\nLast 365 days: issues closed, PRs merged, mean days to fix an '
+          'issue, unlabeled new issues\n')
+    print(TABLE_FORMAT.format('repository', 'issues', 'PRs', 'closed',
+                              'merged', 'days to fix', 'unlabeled'))
+    all_issues = []
+    all_commits = []
+    for name, (repo, store) in sorted(mirrors.items()):
+        issues = store.issues()
+        print(TABLE_FORMAT.format(name, *repo_statistics(issues, now)))
+        # issue numbers are only unique per repository
+        offset = len(all_issues)
+        all_issues.extend(dict(i, number=offset + k)
+                          for k, i in enumerate(issues))
+        if options.plot:
+            all_commits.extend(store.commits())
+    print(TABLE_FORMAT.format('all', *repo_statistics(all_issues, now)))
+
+    if options.plot:
+        if not all_issues:
+            sys.exit('No issues found, nothing to plot.')
+        specs = plot_issue_stats.figure_specs(
+            ['overview'], all_issues, all_commits, [], now,
+            {'events': [], 'event_titles': []}, None, 'default branch',
+            name=options.org)
+        plot_issue_stats.render_figures(
+            specs, os.path.abspath('issue_stats_autosave'), ['png'], [90])
+
+if __name__ == '__main__':
+    main(sys.argv)
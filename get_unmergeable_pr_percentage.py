@@ -1,40 +1,121 @@
 #!/usr/bin/env python3
 
-"""Print the percentage of unmergeable PRs and some associated stats."""
+"""Print the percentage of unmergeable PRs and some associated stats.
+
+If a local repository is configured, mergeability is computed locally with
+'git merge-tree' (requires Git 2.38 or newer), instead of asking Github.
+"""
 
 import github_tools
-from time import sleep
+import sys
+import metrics
+import os
+from time import sleep, time
+from subprocess import check_call, call, DEVNULL
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _poll_mergeable(repo, number, deadline):
+    """Poll a PR until Github knows its mergeable state, or the deadline."""
+
+    p = repo.get_pull(number)
+    delay = 1
+    # Workaround for https://github.com/jacquev6/PyGithub/issues/256
+    while p.mergeable is None:
+        if time() + delay > deadline:
+            return None
+        print('Uncached mergeable state enountered for ' + str(p.number))
+        sleep(delay)
+        delay = min(2 * delay, 32)
+        p.update()
+    return p.mergeable
+
+
+def poll_mergeable(repo, pulls, timeout=120, max_workers=8):
+    """Return a dict of PR number -> mergeable state, asking Github.
+
+    pulls are PR records of a mirror. All PRs are polled concurrently with
+    exponential backoff. PRs whose state is still unknown after timeout
+    seconds are mapped to None.
+    """
+
+    deadline = time() + timeout
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        states = executor.map(metrics.in_context(
+            lambda p: _poll_mergeable(repo, p['number'], deadline)), pulls)
+        return {p['number']: s for p, s in zip(pulls, states)}
+
+
+def _local_ref(kind, name):
+    return 'refs/of_repo_utilities/' + kind + '/' + str(name)
+
+
+def _merge_tree(repo_location, p):
+    """Return if a fetched PR merges cleanly into its fetched base branch."""
+
+    status = call(['git', 'merge-tree', '--write-tree',
+                   _local_ref('base', p['base_ref']),
+                   _local_ref('pull', p['number'])],
+                  stdout=DEVNULL, stderr=DEVNULL, cwd=repo_location)
+    if status not in (0, 1):  # e.g. an older Git without --write-tree
+        return None
+    return status == 0
+
+
+def local_mergeable(repo, pulls, repo_location, max_workers=None):
+    """Return a dict of PR number -> mergeable state, computed locally.
+
+    pulls are PR records of a mirror. PR heads and base branches are fetched
+    in one go, then the merges are computed with 'git merge-tree' in
+    parallel Git processes.
+    """
+
+    refspecs = {'+refs/pull/%d/head:%s' % (p['number'],
+                                           _local_ref('pull', p['number']))
+                for p in pulls}
+    refspecs |= {'+refs/heads/%s:%s' % (p['base_ref'],
+                                        _local_ref('base', p['base_ref']))
+                 for p in pulls}
+    print('Fetching PR heads...')
+    check_call(['git', 'fetch', '--quiet', repo.clone_url] + sorted(refspecs),
+               cwd=repo_location)
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as ex:
+        states = ex.map(lambda p: _merge_tree(repo_location, p), pulls)
+        return {p['number']: s for p, s in zip(pulls, states)}
 
 
-def main():
+def main(args):
     """Main function of get_umergeable_pr_percentage"""
-    repo = github_tools.get_repo()
+    repo, store = github_tools.get_mirror()
     merge_true = 0
     merge_false = 0
-    nr_prs = 0
+    merge_unknown = 0
     unmergeable_urls = []
-    pulls = repo.get_pulls('open')
+    pulls = store.issues(state='open', is_pr=True)
+    nr_prs = len(pulls)
+    repo_location = github_tools.local_repo_location()
+    if repo_location:
+        mergeable = local_mergeable(repo, pulls, repo_location)
+    else:
+        mergeable = poll_mergeable(repo, pulls)
     for p in pulls:
-        nr_prs += 1
-        # Workaround for https://github.com/jacquev6/PyGithub/issues/256
-        while p.mergeable is None:
-            print('Uncached mergeable state enountered for ' + str(p.number))
-            sleep(1)
-            p.update()
-
-        print("nr " + str(p.number) + ", mergeable:" + str(p.mergeable))
-        if p.mergeable:
+        print("nr " + str(p['number']) + ", mergeable:" +
+              str(mergeable[p['number']]))
+        if mergeable[p['number']] is None:
+            merge_unknown += 1
+        elif mergeable[p['number']]:
             merge_true += 1
         else:
             merge_false += 1
-            unmergeable_urls.append(p.html_url)
+            unmergeable_urls.append(p['html_url'])
 
     # sanity check
-    assert nr_prs == (merge_true + merge_false)
+    assert nr_prs == (merge_true + merge_false + merge_unknown)
     print('Open PRs: ' + str(nr_prs) + '\nMergeable: ' + str(merge_true) +
-          '\nUnmergeable: ' + str(merge_false) + '\nPercentage unmergeable: ' +
+          '\nUnmergeable: ' + str(merge_false) + '\nUnknown: ' +
+          str(merge_unknown) + '\nPercentage unmergeable: ' +
           '%.2f' % (100.0 * merge_false / nr_prs))
     github_tools.open_in_browser(unmergeable_urls)
 
 if __name__ == '__main__':
-    main()
+    main(sys.argv)
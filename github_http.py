@@ -0,0 +1,433 @@
+"""
+HTTP connection layer injected into PyGithub's Requester.
+
+PyGithub reuses a single connection object for all requests of a Github
+instance, which is not safe to use from several threads. The connection
+classes here are cheap per-request objects sharing one pooled
+requests.Session per protocol, so pages can be fetched concurrently while
+still reusing kept-alive connections.
+
+GET responses carrying an ETag or Last-Modified header can be kept in a
+persistent cache, and are then revalidated with conditional requests.
+Github answers those with "304 Not Modified" if nothing changed, which
+does not count against the rate limit.
+
+All requests pass through a RateLimitScheduler, which tracks the rate limit
+headers, paces requests when the quota runs low, and waits for the quota
+to reset or for secondary rate limits to clear instead of failing.
+
+Every request is reported to metrics, under the currently active phase.
+
+Requires Python3
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import requests
+from github.Requester import Requester
+import metrics
+
+POOL_SIZE = 16
+CACHE_MAX_BYTES = 200 * 1000 * 1000
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_cache = None
+_scheduler = None
+
+
+def _no_auth(request):
+    return request
+
+
+def _get_session(protocol, retry):
+    """Return the shared session for a protocol, creating it if needed."""
+
+    with _sessions_lock:
+        if protocol not in _sessions:
+            session = requests.Session()
+            # keep requests from replacing the token with .netrc credentials
+            session.auth = _no_auth
+            adapter = requests.adapters.HTTPAdapter(
+                max_retries=(requests.adapters.DEFAULT_RETRIES
+                             if retry is None else retry),
+                pool_connections=POOL_SIZE,
+                pool_maxsize=POOL_SIZE)
+            session.mount(protocol + '://', adapter)
+            _sessions[protocol] = session
+        return _sessions[protocol]
+
+
+class ResponseCache(object):
+    """Persistent, size-bounded LRU cache of GET responses."""
+
+    def __init__(self, path, max_bytes=CACHE_MAX_BYTES):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    headers TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS responses_last_access
+                    ON responses (last_access);
+                """)
+            self._size = self._db.execute('SELECT TOTAL(size) FROM responses'
+                                          ).fetchone()[0]
+
+    @staticmethod
+    def key(url, authorization):
+        """Return the cache key for a URL and auth scope."""
+
+        scope = hashlib.sha256((authorization or '').encode()).hexdigest()
+        return scope[:16] + ' ' + url
+
+    def lookup(self, key):
+        """Return a cached entry as dict, or None. Marks the entry as used."""
+
+        with self._lock, self._db:
+            row = self._db.execute('SELECT etag, last_modified, headers, body '
+                                   'FROM responses WHERE key = ?',
+                                   (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute('UPDATE responses SET last_access = ? '
+                             'WHERE key = ?', (time.time(), key))
+        return {'etag': row[0],
+                'last_modified': row[1],
+                'headers': json.loads(row[2]),
+                'body': row[3]}
+
+    def store(self, key, etag, last_modified, headers, body):
+        """Store a response, evicting least recently used entries."""
+
+        headers_json = json.dumps(headers)
+        size = len(headers_json) + len(body)
+        if size > self.max_bytes:
+            return
+        with self._lock, self._db:
+            old = self._db.execute('SELECT size FROM responses WHERE key = ?',
+                                   (key,)).fetchone()
+            if old:
+                self._size -= old[0]
+            self._db.execute('INSERT OR REPLACE INTO responses VALUES '
+                             '(?, ?, ?, ?, ?, ?, ?)',
+                             (key, etag, last_modified, headers_json,
+                              body, size, time.time()))
+            self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Remove least recently used entries until within max_bytes."""
+
+        evicted = []
+        for key, size in self._db.execute('SELECT key, size FROM responses '
+                                          'ORDER BY last_access'):
+            if self._size <= self.max_bytes:
+                break
+            evicted.append((key,))
+            self._size -= size
+        self._db.executemany('DELETE FROM responses WHERE key = ?', evicted)
+
+
+class RateLimitScheduler(object):
+    """Pace concurrent requests to fit into a rate limit budget.
+
+    budget is the fraction of each rate limit window this process may use,
+    so several scripts can share one token. reserve requests are always
+    left untouched. Once less than pace_below requests of the allowance are
+    left, the rest are spread evenly until the window resets.
+    """
+
+    def __init__(self, budget=1.0, max_concurrent=8, reserve=20,
+                 pace_below=200, max_retries=6):
+        self.budget = budget
+        self.reserve = reserve
+        self.pace_below = pace_below
+        self.max_retries = max_retries
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._limits = {}  # rate limit state per resource
+        self._next_request = {}  # earliest start of the next paced request
+
+    @staticmethod
+    def resource(url):
+        """Return the rate limit resource a request URL is counted against."""
+
+        path = url.split('?')[0]
+        if path.endswith('/graphql'):
+            return 'graphql'
+        if '/search/' in path:
+            return 'search'
+        return 'core'
+
+    def status(self):
+        """Return a dict of the known rate limit state, per resource."""
+
+        with self._lock:
+            return {k: dict(v) for k, v in self._limits.items()}
+
+    def _delay(self, resource):
+        """Return (seconds to wait, if the request may start after waiting).
+
+        In paced mode, a start time is reserved for the request. If the
+        budget is used up, the state has to be checked again after waiting.
+        """
+
+        now = time.time()
+        state = self._limits.get(resource)
+        if state is None:
+            return 0, True
+        if state['reset'] <= now:
+            # new window, the next response will tell the real numbers
+            state['remaining'] = state['limit']
+            state['used'] = 0
+            return 0, True
+        allowance = min(state['remaining'] - self.reserve,
+                        self.budget * state['limit'] - state['used'])
+        allowance -= state['in_flight']
+        if allowance <= 0:
+            return state['reset'] - now + 1, False
+        if allowance < self.pace_below:
+            interval = (state['reset'] - now) / allowance
+            start = max(now, self._next_request.get(resource, now))
+            self._next_request[resource] = start + interval
+            return start - now, True
+        return 0, True
+
+    def acquire(self, resource):
+        """Block until a request may be sent."""
+
+        while True:
+            with self._lock:
+                delay, reserved = self._delay(resource)
+                if reserved:
+                    # counted from now on, so later requests are paced
+                    # after this one
+                    state = self._limits.get(resource)
+                    if state:
+                        state['in_flight'] += 1
+            if delay > 10:
+                print('Rate limit budget for ' + resource +
+                      ' used up, pausing until ' +
+                      time.strftime('%H:%M:%S',
+                                    time.localtime(time.time() + delay)))
+            if delay > 0:
+                time.sleep(delay)
+            if reserved:
+                break
+        self._slots.acquire()
+
+    def release(self, resource, headers):
+        """Update the rate limit state from response headers."""
+
+        self._slots.release()
+        with self._lock:
+            state = self._limits.get(resource)
+            if state:
+                state['in_flight'] = max(state['in_flight'] - 1, 0)
+            if headers is None or 'X-RateLimit-Remaining' not in headers:
+                return
+            resource = headers.get('X-RateLimit-Resource', resource)
+            state = self._limits.setdefault(resource, {'in_flight': 0,
+                                                       'used': 0})
+            reset = int(headers.get('X-RateLimit-Reset', 0))
+            if reset != state.get('reset'):
+                state['used'] = 0
+            state['used'] += 1
+            state['limit'] = int(headers.get('X-RateLimit-Limit', 0))
+            state['remaining'] = int(headers['X-RateLimit-Remaining'])
+            state['reset'] = reset
+
+    def retry_delay(self, status, headers, text, attempt):
+        """Return seconds to wait before retrying a response, or None.
+
+        Handles exhausted primary rate limits as well as secondary (abuse)
+        rate limits, using exponential backoff if no hint is given.
+        """
+
+        if status not in (403, 429) or attempt >= self.max_retries:
+            return None
+        if 'Retry-After' in headers:
+            return int(headers['Retry-After'])
+        if headers.get('X-RateLimit-Remaining') == '0':
+            return max(int(headers.get('X-RateLimit-Reset', 0)) -
+                       time.time(), 0) + 1
+        lowered = text.lower()
+        if 'secondary rate limit' in lowered or 'abuse' in lowered:
+            return 60 * 2 ** attempt
+        return None
+
+
+class Response(object):
+    """Mimic the httplib response object expected by PyGithub.
+
+    A streamed response keeps the requests response, whose body is only
+    read by iter_content.
+    """
+
+    def __init__(self, status, headers, text, response=None):
+        self.status = status
+        self.headers = headers
+        self.text = text
+        self.response = response
+
+    def getheaders(self):
+        return self.headers.items()
+
+    def read(self):
+        if self.response is not None:
+            return self.response.text or ''
+        return self.text
+
+    def iter_content(self, chunk_size=1):
+        if self.response is not None:
+            return self.response.iter_content(chunk_size=chunk_size)
+        return iter([self.text.encode()])
+
+    def raise_for_status(self):
+        if self.response is not None:
+            self.response.raise_for_status()
+        elif self.status >= 400:
+            raise requests.HTTPError(str(self.status) + ' error')
+
+
+class HTTPSConnection(object):
+    """Mimic the httplib connection object expected by PyGithub."""
+
+    protocol = 'https'
+    default_port = 443
+
+    def __init__(self, host, port=None, strict=False, timeout=None,
+                 retry=None, pool_size=None, **kwargs):
+        self.host = host
+        self.port = port if port else self.default_port
+        self.timeout = timeout
+        self.verify = kwargs.get('verify', True)
+        self.session = _get_session(self.protocol, retry)
+
+    def request(self, verb, url, input, headers, stream=False):
+        # stream is passed by PyGithub 2.x, e.g. for downloading assets
+        self.verb = verb
+        self.url = url
+        self.input = input
+        self.headers = headers
+        self.stream = stream
+
+    def getresponse(self):
+        full_url = (self.protocol + '://' + self.host + ':' + str(self.port) +
+                    self.url)
+        headers = dict(self.headers)
+        cache = _cache if self.verb == 'GET' and not self.stream else None
+        cached = None
+        if cache:
+            key = cache.key(full_url, headers.get('Authorization'))
+            cached = cache.lookup(key)
+            if cached:
+                if cached['etag']:
+                    headers['If-None-Match'] = cached['etag']
+                if cached['last_modified']:
+                    headers['If-Modified-Since'] = cached['last_modified']
+        r = self._send(full_url, headers)
+        response_headers = dict(r.headers)
+        if self.stream:
+            return Response(r.status_code, response_headers, None, r)
+        if cached and r.status_code == 304:
+            # Serve the cached body, but keep e.g. fresh rate limit headers.
+            cached['headers'].update(response_headers)
+            return Response(200, cached['headers'], cached['body'])
+        etag = r.headers.get('ETag')
+        last_modified = r.headers.get('Last-Modified')
+        if cache and r.status_code == 200 and (etag or last_modified):
+            cache.store(key, etag, last_modified, response_headers, r.text)
+        return Response(r.status_code, response_headers, r.text)
+
+    def _send(self, full_url, headers):
+        """Send the request under control of the rate limit scheduler."""
+
+        resource = _scheduler.resource(self.url)
+        attempt = 0
+        while True:
+            _scheduler.acquire(resource)
+            r = None
+            start = time.time()
+            try:
+                r = self.session.request(self.verb, full_url,
+                                         headers=headers,
+                                         data=self.input,
+                                         timeout=self.timeout,
+                                         verify=self.verify,
+                                         allow_redirects=False,
+                                         stream=self.stream)
+            finally:
+                # a failed response is falsy, but its headers count
+                _scheduler.release(resource,
+                                   r.headers if r is not None else None)
+            if self.stream and r.ok:
+                # the body is read later, by iter_content
+                received = int(r.headers.get('Content-Length', 0))
+                text = ''
+            else:
+                received = len(r.content)
+                text = r.text
+            # input may also be a file, e.g. for uploads
+            sent = (len(self.input) if isinstance(self.input, (str, bytes))
+                    else 0)
+            metrics.record_request(resource, r.status_code, sent, received,
+                                   time.time() - start, r.headers)
+            delay = _scheduler.retry_delay(r.status_code, r.headers, text,
+                                           attempt)
+            if delay is None:
+                return r
+            print('Rate limited (HTTP ' + str(r.status_code) +
+                  '), retrying in ' + str(int(delay)) + 's')
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        # the shared session stays open for reuse
+        return
+
+
+class HTTPConnection(HTTPSConnection):
+    """Plain HTTP variant, e.g. for a local stand-in API server."""
+
+    protocol = 'http'
+    default_port = 80
+
+
+def install(cache_path=None, cache_max_bytes=CACHE_MAX_BYTES,
+            rate_budget=1.0):
+    """Make PyGithub use the connection classes of this module.
+
+    If cache_path is given, GET responses are cached there. Otherwise, the
+    cache is disabled. rate_budget is the fraction of the rate limit this
+    process may use, see RateLimitScheduler.
+    """
+
+    global _cache, _scheduler
+    if _scheduler is None:
+        _scheduler = RateLimitScheduler(budget=rate_budget)
+    else:
+        _scheduler.budget = rate_budget
+    if cache_path is None:
+        _cache = None
+    elif _cache is None or _cache.path != cache_path:
+        _cache = ResponseCache(cache_path, max_bytes=cache_max_bytes)
+    Requester.injectConnectionClasses(HTTPConnection, HTTPSConnection)
@@ -2,27 +2,69 @@
 A set of small helper functions for interacting with Github repositories
 (primarily openFrameworks) via PyGithub.
 
+PyGithub and other heavy modules are only imported when first needed, so
+importing this module (e.g. to show a script's help) is fast.
+
 Requires Python3
 """
 
 import os
 import sys
+import glob
+import json
 import inspect
-import webbrowser
-from subprocess import check_call, CalledProcessError, DEVNULL
-from github import Github
-import psutil
+import datetime
+from subprocess import (check_call, check_output, call, CalledProcessError,
+                        DEVNULL, Popen, PIPE)
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+import repo_store
 
 if sys.version_info < (3, 0):
     sys.exit('github_tools requires Python 3.0 or greater')
 # TODO: See if a py2/py3 compatible codebase can reasonably be achieved.
-# TODO: Add a convenience function returning rate limit info
 # TODO: Check proper PY3 UTF-8 string handling
 
+# The API server can be overridden, e.g. to point the scripts at a stand-in
+# server like fake_github_server
+API_URL = os.environ.get('GITHUB_API_URL', 'https://api.github.com')
+# If set, request metrics are written to this file at exit, see metrics.write
+METRICS_FILE = os.environ.get('GITHUB_METRICS_FILE')
+# Set to 0 to disable the on-disk response cache, see get_github_instance
+HTTP_CACHE = os.environ.get('GITHUB_HTTP_CACHE', '1').lower() not in (
+    '0', 'false', 'no', 'off')
+# Default number of elements per page of API listings
+PER_PAGE = 100
+
+# Github instances, repos and synced mirrors, reused within a process, e.g.
+# when several subcommands of of_repo run in one invocation
+_instances = {}
+_repos = {}
+_mirrors = {}
+# Allowed difference between the local and the API server clock, when
+# listing issues updated since the start of the last sync
+SYNC_MARGIN = datetime.timedelta(minutes=5)
+
 
-def get_github_instance(token='github_token.txt', timeout=20):
-    """Return a token-authenticated Github instance."""
+def get_github_instance(token='github_token.txt', timeout=20,
+                        base_url=None, per_page=PER_PAGE,
+                        cache=HTTP_CACHE, rate_budget=1.0):
+    """Return a token-authenticated Github instance.
+
+    base_url can point to a stand-in API server, e.g. for testing. It
+    defaults to API_URL.
+    If cache is True, responses are cached on disk and revalidated with
+    conditional requests, see github_http. It defaults to HTTP_CACHE.
+    rate_budget is the fraction of the rate limit this process may use, so
+    several scripts can run at once with one token.
+    Instances are reused for the same arguments.
+    """
 
+    key = (token, timeout, base_url or API_URL, per_page, cache, rate_budget)
+    if key in _instances:
+        return _instances[key]
+    from github import Github
+    import github_http
     currentdir = os.path.dirname(os.path.abspath(
         inspect.getfile(inspect.currentframe())))
     tokenpath = os.path.join(currentdir, token)
@@ -34,21 +76,109 @@ def get_github_instance(token='github_token.txt', timeout=20):
         sys.exit('Token file ' + tokenpath + ' not found.\n' +
                  'Please create it, containing your Github access token.')
 
-    return Github(my_token, timeout=timeout)
+    if cache:
+        cache_path = os.path.join(currentdir, 'issue_stats_pickles',
+                                  'http_cache.sqlite')
+    else:
+        cache_path = None
+    github_http.install(cache_path=cache_path, rate_budget=rate_budget)
+    if METRICS_FILE:
+        metrics.export_at_exit(METRICS_FILE)
+    kwargs = {}
+    if 'seconds_between_requests' in inspect.signature(Github).parameters:
+        # PyGithub 2 spaces requests on its own, which would serialize
+        # concurrent fetches. The scheduler in github_http paces instead.
+        kwargs.update(seconds_between_requests=None,
+                      seconds_between_writes=None)
+    try:
+        from github import Auth
+        kwargs['auth'] = Auth.Token(my_token)
+    except ImportError:  # PyGithub before 1.59
+        kwargs['login_or_token'] = my_token
+    _instances[key] = Github(base_url=base_url or API_URL, timeout=timeout,
+                             per_page=per_page, **kwargs)
+    return _instances[key]
 
 
 def get_repo(user='openframeworks', repo='openFrameworks',
-             token='github_token.txt', timeout=20):
-    """Return Github authenticated repo, ready for use."""
+             token='github_token.txt', timeout=20, base_url=None,
+             cache=HTTP_CACHE):
+    """Return Github authenticated repo, ready for use.
+
+    Repos are reused for the same arguments.
+    """
+
+    key = (user, repo, token, timeout, base_url or API_URL, cache)
+    if key not in _repos:
+        gh_instance = get_github_instance(token=token, timeout=timeout,
+                                          base_url=base_url, cache=cache)
+        _repos[key] = gh_instance.get_user(user).get_repo(repo)
+    return _repos[key]
+
+
+def fetch_pages(paginated_list, max_workers=8, start=0, max_pages=None,
+                per_page=PER_PAGE):
+    """Yield the pages of a PyGithub PaginatedList, fetched in parallel.
+
+    If the first page is full, the number of pages is learned from the Link
+    header of a second request, then the remaining pages are fetched
+    concurrently on a bounded thread pool. Pages are yielded in listing
+    order, as soon as they are available.
+    Elements added after the first request may be missed, sync_issues
+    fetches them on its next run.
+    Pages before the (0-based) page start are skipped, and at most
+    max_pages pages are fetched, if given. per_page is the page size of the
+    Github instance the list comes from, see get_github_instance.
+    """
+
+    first_page = paginated_list.get_page(start)
+    yield first_page
+    if len(first_page) < per_page:
+        return
+    # totalCount reads the last page number from the Link header of a
+    # request with one element per page, i.e. the total number of elements.
+    # Search results include it in the first page.
+    nr_pages = max(-(-paginated_list.totalCount // per_page), start + 1)
+    if max_pages is not None:
+        nr_pages = min(nr_pages, start + max_pages)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for page in executor.map(metrics.in_context(paginated_list.get_page),
+                                 range(start + 1, nr_pages)):
+            yield page
+
+
+def fetch_all(paginated_list, max_workers=8, max_pages=None,
+              per_page=PER_PAGE):
+    """Return a list of all elements of a PyGithub PaginatedList.
+
+    Drop-in replacement for iterating over the list, but pages are fetched
+    in parallel, see fetch_pages.
+    """
+
+    return [element
+            for page in fetch_pages(paginated_list, max_workers=max_workers,
+                                    max_pages=max_pages, per_page=per_page)
+            for element in page]
 
-    gh_instance = get_github_instance(token=token, timeout=timeout)
-    return gh_instance.get_user(user).get_repo(repo)
+
+def rate_limit_info():
+    """Return the last known rate limit state, per resource.
+
+    E.g. {'core': {'limit': 5000, 'remaining': 4990, 'reset': 1400000000,
+    'used': 10, 'in_flight': 0}}
+    """
+
+    import github_http
+    if github_http._scheduler is None:
+        return {}
+    return github_http._scheduler.status()
 
 
 def open_in_browser(list_of_urls):
     """Offer to open a list of URLs in the browser."""
 
     if list_of_urls:
+        import webbrowser
         answer = input('Press "y" to open all issues in the browser, ' +
                        'other key to quit:\n')
         if answer.lower() == 'y':
@@ -58,19 +188,21 @@ def open_in_browser(list_of_urls):
             print('Done')
 
 
-def validate_tagname(repo, tagname):
+def validate_tagname(repo, tagname, store=None):
     """Try to find a given tagname in a repo's tags.
 
     If no tagname is given, find the youngest tag.
+    If a RepoStore with an up-to-date tag index is given, it is used as is.
     Return a dict containing tag name and tag date
     """
 
-    print('Fetching tags...')
-    tags = repo.get_tags()
-    tag_list = []
-    for t in tags:
-        tag_list.append({'name': t.name,
-                         'date': t.commit.commit.committer.date})
+    if store is None:
+        print('Fetching tags...')
+        with repo_store.RepoStore(repo_store.default_path(
+                repo.owner.login, repo.name)) as store:
+            tag_list = update_tag_index(repo, store, local_repo_location())
+    else:
+        tag_list = store.tags()
 
     if not tagname:
         # no tagname was given, choose the youngest tag
@@ -88,6 +220,414 @@ def validate_tagname(repo, tagname):
     return tag
 
 
+def graphql(github_object, query, variables=None):
+    """Run a GraphQL query with the requester of a PyGithub object.
+
+    Return the 'data' part of the response.
+    """
+
+    from github import GithubException
+    headers, data = github_object._requester.requestJsonAndCheck(
+        'POST', '/graphql', input={'query': query,
+                                   'variables': variables or {}})
+    if data.get('errors'):
+        raise GithubException(200, data['errors'], headers)
+    return data['data']
+
+
+def parse_github_date(date_string):
+    """Convert an ISO 8601 date from the Github API to a naive UTC datetime."""
+
+    return datetime.datetime.strptime(date_string, '%Y-%m-%dT%H:%M:%SZ')
+
+
+def resolve_user_names(github_object, logins, store, max_age=7*24*3600,
+                       batch_size=50):
+    """Return a dict of login -> name (or None) for a set of logins.
+
+    Names are taken from the user cache in a RepoStore if fetched within
+    max_age seconds. The rest is fetched with one GraphQL query per
+    batch_size users, and cached.
+    """
+
+    names = store.user_names(max_age=max_age)
+    missing = sorted(set(logins) - set(names))
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        query = '{' + ' '.join('u%d: user(login: %s) { name }' %
+                               (i, json.dumps(login))
+                               for i, login in enumerate(batch)) + '}'
+        data = graphql(github_object, query)
+        records = [{'login': login,
+                    'name': (data['u%d' % i] or {}).get('name')}
+                   for i, login in enumerate(batch)]
+        store.upsert_users(records)
+        names.update((r['login'], r['name']) for r in records)
+    return {login: names[login] for login in logins}
+
+
+def iter_local_tags(repo_location):
+    """Yield tag records (name, commit sha and commit date) from a local repo.
+
+    Annotated tags are dereferenced to the tagged commit.
+    """
+
+    output = check_output(['git', 'for-each-ref', 'refs/tags',
+                           '--format=%(refname:short)%09%(objectname)%09'
+                           '%(committerdate:unix)%09%(*objectname)%09'
+                           '%(*committerdate:unix)'],
+                          cwd=repo_location, universal_newlines=True)
+    for line in output.splitlines():
+        name, sha, date, deref_sha, deref_date = line.split('\t')
+        if deref_date:  # annotated tag
+            sha, date = deref_sha, deref_date
+        if not date:  # tag of something else than a commit
+            continue
+        yield {'name': name,
+               'sha': sha,
+               'date': datetime.datetime.utcfromtimestamp(int(date))}
+
+
+_TAGS_QUERY = """
+query($owner: String!, $name: String!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    refs(refPrefix: "refs/tags/", first: 100, after: $cursor,
+         orderBy: {field: TAG_COMMIT_DATE, direction: DESC}) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        name
+        target {
+          ... on Commit { oid committedDate }
+          ... on Tag { target { ... on Commit { oid committedDate } } }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+def iter_api_tags(repo):
+    """Yield the tag records of a Github repo, newest first, with one GraphQL
+    query per 100 tags.
+    """
+
+    cursor = None
+    while True:
+        refs = graphql(repo, _TAGS_QUERY, {'owner': repo.owner.login,
+                                           'name': repo.name,
+                                           'cursor': cursor}
+                       )['repository']['refs']
+        for node in refs['nodes']:
+            commit = node['target'].get('target', node['target'])
+            if 'oid' not in commit:  # tag of something else than a commit
+                continue
+            yield {'name': node['name'],
+                   'sha': commit['oid'],
+                   'date': parse_github_date(commit['committedDate'])}
+        if not refs['pageInfo']['hasNextPage']:
+            return
+        cursor = refs['pageInfo']['endCursor']
+
+
+def update_tag_index(repo, store, repo_location=None):
+    """Update the tag index in a RepoStore, and return all tags in it.
+
+    All tags are read from a local Git repo if given, otherwise from Github,
+    and compared to the index. Deleted tags are removed from the index, new
+    and moved tags are stored.
+    """
+
+    if repo_location:
+        tags = list(iter_local_tags(repo_location))
+    else:
+        tags = list(iter_api_tags(repo))
+    known = {t['name']: t['sha'] for t in store.tags()}
+    store.delete_tags(set(known) - {t['name'] for t in tags})
+    store.upsert_tags(t for t in tags if known.get(t['name']) != t['sha'])
+    return store.tags()
+
+
+def iter_updated_issue_pages(repo, since, per_page=PER_PAGE):
+    """Yield pages of the issues of a repo updated since a date, least
+    recently updated first.
+
+    Pages are requested one after another, each for the issues updated since
+    the last update on the previous page. An issue updated in the meantime
+    thus moves behind the issues not fetched yet, instead of shifting them
+    onto pages that were already fetched. Issues on the boundary of two
+    pages are fetched twice.
+    """
+
+    page_nr = 0
+    while True:
+        page = repo.get_issues(state='all', sort='updated', direction='asc',
+                               since=since).get_page(page_nr)
+        yield page
+        if len(page) < per_page:
+            return
+        last_update = repo_store.naive_utc(page[-1].updated_at)
+        if last_update > since:
+            since, page_nr = last_update, 0
+        else:
+            # a full page of issues updated within the same second
+            page_nr += 1
+
+
+def sync_issues(repo, store):
+    """Fetch issues (including PRs) updated since the last sync into a
+    RepoStore. Return the number of updated issues.
+
+    The first sync lists all issues in order of creation, which does not
+    shift while issues are updated, and stores them page by page. An
+    interrupted first sync resumes after its last stored page. Later syncs
+    fetch the issues updated since the start of the last completed sync,
+    see iter_updated_issue_pages, so issues changed during a sync are
+    fetched again by the next one.
+    If issues changed and NumPy is installed, their new state is recorded in
+    the store's IssueHistory.
+    """
+
+    started = datetime.datetime.utcnow() - SYNC_MARGIN
+    synced_at = store.get_meta('issues_synced_at')
+    if (synced_at is None and store.get_meta('issues_page') is None and
+            store.issue_count()):
+        # stores of earlier versions only know their newest update
+        synced_at = repo_store.to_timestamp(store.last_update())
+    if synced_at is not None:
+        since = repo_store.from_timestamp(int(synced_at))
+        print('Last synced at ' + str(since) + ' UTC')
+        pages = iter_updated_issue_pages(repo, since)
+    else:
+        # Issue listing payloads are used as they are. A full update() of
+        # every issue takes one request each, and is very slow!
+        # (15+ min and 10-20kB/s)
+        # skipping this step takes 100 requests for 3000 issues and ca 2min
+        issues = repo.get_issues(state='all', sort='created', direction='asc')
+        start = int(store.get_meta('issues_page', 0))
+        if start:
+            print('Resuming the first sync after page ' + str(start))
+            started = repo_store.from_timestamp(
+                int(store.get_meta('issues_started')))
+        else:
+            store.set_meta('issues_started', repo_store.to_timestamp(started))
+        pages = fetch_pages(issues, start=start)
+    updated = set()
+    for k, page in enumerate(pages, 1):
+        records = [repo_store.issue_record(i) for i in page]
+        store.upsert_issues(records)
+        updated.update(r['number'] for r in records)
+        if synced_at is None:
+            store.set_meta('issues_page', start + k)
+    store.set_meta('issues_synced_at', repo_store.to_timestamp(started))
+    counter = len(updated)
+    if counter and store.path != ':memory:':
+        try:
+            import issue_history
+        except ImportError:  # NumPy is not installed
+            print('NumPy not found, the issue history is not recorded')
+        else:
+            history = issue_history.IssueHistory(
+                os.path.splitext(store.path)[0] + '_history')
+            history.record(store.issues())
+    return counter
+
+
+def sync_pulls(repo, store):
+    """Fetch PR specific data of PRs updated since the last sync into a
+    RepoStore. Return the number of updated PRs.
+
+    PRs are listed by their last update, newest first, so the listing stops
+    at the first PR not updated since the last sync.
+    """
+
+    last_update = repo_store.from_timestamp(
+        int(store.get_meta('pulls_updated_at', 0)))
+    newest = last_update
+    records = []
+    for p in repo.get_pulls(state='all', sort='updated', direction='desc'):
+        updated_at = repo_store.naive_utc(p.updated_at)
+        if updated_at < last_update:
+            break
+        newest = max(newest, updated_at)
+        records.append(repo_store.pull_record(p))
+    store.update_pulls(records)
+    store.set_meta('pulls_updated_at', repo_store.to_timestamp(newest))
+    return len(records)
+
+
+def sync_labels(repo, store):
+    """Replace the labels in a RepoStore with the current repository labels."""
+
+    store.replace_labels({'name': l.name, 'color': l.color}
+                         for l in fetch_all(repo.get_labels()))
+
+
+def sync_mirror(repo, store, repo_location=None):
+    """Bring the local mirror of a repo in a RepoStore up to date.
+
+    Issues, PRs, labels and tags are updated incrementally. User names are
+    resolved on demand, see resolve_user_names.
+    """
+
+    print('Syncing local mirror of ' + repo.full_name)
+    nr_issues = sync_issues(repo, store)
+    nr_pulls = sync_pulls(repo, store)
+    sync_labels(repo, store)
+    nr_tags = len(update_tag_index(repo, store, repo_location))
+    # one write, as several mirrors may be synced concurrently
+    print(repo.full_name + ': ' + str(nr_issues) + ' issue(s) and ' +
+          str(nr_pulls) + ' PR(s) updated, ' + str(nr_tags) +
+          ' tags on record\n', end='')
+
+
+def get_mirror(user='openframeworks', repo='openFrameworks', offline=False):
+    """Return a Github repo and its synced local mirror RepoStore.
+
+    If offline, the mirror is used as is, and None is returned for the repo.
+    A mirror is only synced once per process.
+    """
+
+    if (user, repo) in _mirrors:
+        return _mirrors[(user, repo)]
+    store = repo_store.RepoStore(repo_store.default_path(user, repo))
+    if offline:
+        if store.issue_count() == 0:
+            sys.exit('No local mirror of ' + user + '/' + repo + ' found, ' +
+                     'please run once without --offline.')
+        print('Using local mirror, last updated at ' +
+              str(store.last_update()) + ' UTC')
+        return None, store
+    gh_repo = get_repo(user, repo)
+    sync_mirror(gh_repo, store, local_repo_location())
+    _mirrors[(user, repo)] = (gh_repo, store)
+    return gh_repo, store
+
+
+def has_mirror(user='openframeworks', repo='openFrameworks'):
+    """Return True if a local mirror of a repo holds issues, see get_mirror.
+
+    Scripts can then answer a query without syncing a full mirror first.
+    """
+
+    if (user, repo) in _mirrors:
+        return True
+    with repo_store.RepoStore(repo_store.default_path(user, repo)) as store:
+        return store.issue_count() > 0
+
+
+def get_org_repos(org='openframeworks', include_forks=False):
+    """Return the repos of an organization, sorted by name."""
+
+    gh_instance = get_github_instance()
+    repos = fetch_all(gh_instance.get_organization(org).get_repos())
+    # the raw data, accessing missing attributes costs requests
+    return sorted((r for r in repos
+                   if include_forks or not r._rawData.get('fork')),
+                  key=lambda r: r.name.lower())
+
+
+def sync_org_mirrors(org='openframeworks', offline=False, commits=False,
+                     force=False, max_workers=2):
+    """Return a dict of repo name -> (Github repo, synced RepoStore) of all
+    repos of an organization.
+
+    Every repo has its own mirror, see get_mirror. Mirrors are synced
+    concurrently, sharing the connection pool and rate limit budget. A repo
+    is skipped if its push and update dates and open issue count in the
+    organization's repo listing did not change since its last sync, unless
+    force is set. Changes not visible in the listing, e.g. only relabeled
+    issues, are thus picked up with force, or with a later change.
+    With commits, the commits of the default branches are synced too, see
+    update_api_commits.
+    If offline, the existing mirrors are used as they are, with None for
+    the repos.
+    """
+
+    if offline:
+        prefix = repo_store.default_path(org, '')[:-len('.sqlite')]
+        paths = sorted(glob.glob(prefix + '*.sqlite'))
+        if not paths:
+            sys.exit('No local mirrors of ' + org + ' found, ' +
+                     'please run once without --offline.')
+        return {p[len(prefix):-len('.sqlite')]:
+                (None, repo_store.RepoStore(p)) for p in paths}
+
+    def sync(repo):
+        store = repo_store.RepoStore(repo_store.default_path(org, repo.name))
+        raw = repo._rawData
+        listing = json.dumps([raw.get('pushed_at'), raw.get('updated_at'),
+                              raw.get('open_issues')])
+        if force or store.get_meta('org_listing') != listing:
+            sync_mirror(repo, store)
+            store.set_meta('org_listing', listing)
+        else:
+            print(repo.full_name + ': unchanged since the last sync\n',
+                  end='')
+        if commits:
+            update_api_commits(repo, store)
+        return store
+
+    repos = get_org_repos(org)
+    print('Syncing ' + str(len(repos)) + ' repos of ' + org)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        stores = list(executor.map(metrics.in_context(sync), repos))
+    return {r.name: (r, s) for r, s in zip(repos, stores)}
+
+
+def _closed_by(repo, store, record, closers):
+    """Set the closer of an issue record from closers, or fetch it."""
+
+    if record['closed_by'] is None and repo is not None:
+        if record['number'] not in closers:
+            # not found in the events, fall back to the full issue
+            closed_by = repo.get_issue(record['number']).closed_by
+            closers[record['number']] = closed_by.login if closed_by else None
+        record['closed_by'] = closers[record['number']]
+        store.set_closed_by(record['number'], record['closed_by'])
+    return record
+
+
+def iter_closers(repo, store, records, since):
+    """Yield closed issue records with their closer, newest closed first.
+
+    Closers are not part of the issue listing. Missing ones are taken from
+    the repo's issue events (newest first, one page at a time, down to the
+    since date) and cached in the store. Records are yielded as soon as no
+    later page can affect them. If repo is None, records are yielded as
+    they are.
+    """
+
+    records = sorted(records, key=lambda r: r['closed_at'], reverse=True)
+    missing = {r['number'] for r in records if r['closed_by'] is None}
+    closers = {}
+    position = 0
+    if missing and repo is not None:
+        events = repo.get_issues_events()
+        page_number = 0
+        while missing:
+            page = events.get_page(page_number)
+            page_number += 1
+            if not page:
+                break
+            for e in page:
+                # the raw data, accessing missing attributes costs requests
+                raw = e._rawData
+                number = (raw.get('issue') or {}).get('number')
+                if raw['event'] == 'closed' and number in missing:
+                    missing.remove(number)
+                    closers[number] = (raw.get('actor') or {}).get('login')
+            oldest = parse_github_date(page[-1]._rawData['created_at'])
+            while (position < len(records) and
+                   records[position]['closed_at'] > oldest):
+                yield _closed_by(repo, store, records[position], closers)
+                position += 1
+            if oldest < since:
+                break
+    for record in records[position:]:
+        yield _closed_by(repo, store, record, closers)
+
+
 def local_repo_location(location_file='local_repo_location.txt'):
     """Return the path to a local Git repo, if defined in a location file."""
 
@@ -111,18 +651,149 @@ def local_repo_location(location_file='local_repo_location.txt'):
         sys.exit(str(repo_location) + ' is not a valid Git repository!')
 
 
-def log_traffic():
-    """Log consumed network bandwidth since last call to console."""
+def iter_local_commits(repo_location, revision):
+    """Yield commit records from the local Git log of a revision (range).
 
-    my_io = psutil.net_io_counters
-    try:
-        log_traffic.store['kB_recv'].append(my_io().bytes_recv/1000)
-        log_traffic.store['kB_sent'].append(my_io().bytes_sent/1000)
-        print('Traffic: ' +
-              '{0:.2f}kB down / '.format(log_traffic.store['kB_recv'][-1] -
-                                         log_traffic.store['kB_recv'][-2]) +
-              '{0:.2f}kB up'.format(log_traffic.store['kB_sent'][-1] -
-                                    log_traffic.store['kB_sent'][-2]))
-    except AttributeError:  # store not initialized yet
-        log_traffic.store = {'kB_recv': [my_io().bytes_recv/1000],
-                             'kB_sent': [my_io().bytes_sent/1000]}
+    The log is read as a stream with fixed-format Unix timestamps, so no
+    generic date parsing is needed.
+    """
+
+    process = Popen(['git', '--no-pager', 'log', '--format=%H %ct %at %P',
+                     revision, '--'],
+                    stdout=PIPE, cwd=repo_location, universal_newlines=True)
+    with process:
+        for line in process.stdout:
+            # sha, committer date, author date, parents
+            fields = line.split()
+            yield {'sha': fields[0],
+                   'committer_date': datetime.datetime.utcfromtimestamp(
+                       int(fields[1])),
+                   'author_date': datetime.datetime.utcfromtimestamp(
+                       int(fields[2])),
+                   'parents': fields[3:]}
+    if process.returncode:
+        raise CalledProcessError(process.returncode, process.args)
+
+
+def update_local_commits(store, repo_location, branch, batch_size=10000):
+    """Ingest the commits of a local branch into a RepoStore.
+
+    Only the commits since the last ingested one are read. If the branch
+    history was rewritten in between, all commits are read again.
+    Return the number of new commits.
+    """
+
+    head = check_output(['git', 'rev-parse', '--verify', branch],
+                        cwd=repo_location, universal_newlines=True).rstrip()
+    # shared with update_api_commits, both ingest the same commits
+    meta_key = 'commits_head:' + branch
+    last_sha = store.get_meta(meta_key)
+    if last_sha == head:
+        return 0
+    if last_sha and call(['git', 'merge-base', '--is-ancestor',
+                          last_sha, head],
+                         stderr=DEVNULL, cwd=repo_location) == 0:
+        revision = last_sha + '..' + head
+    else:
+        store.clear_commits()
+        revision = head
+    counter = 0
+    batch = []
+    for commit in iter_local_commits(repo_location, revision):
+        batch.append(commit)
+        if len(batch) == batch_size:
+            counter += store.upsert_commits(batch)
+            batch = []
+    counter += store.upsert_commits(batch)
+    store.set_meta(meta_key, head)
+    return counter
+
+
+_HISTORY_QUERY = """
+query($owner: String!, $name: String!, $branch: String!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    ref(qualifiedName: $branch) {
+      target {
+        ... on Commit {
+          history(first: 100, after: $cursor) {
+            pageInfo { hasNextPage endCursor }
+            nodes {
+              oid authoredDate committedDate
+              parents(first: 100) { nodes { oid } }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+def iter_api_commit_pages(repo, branch):
+    """Yield pages of commit records of a branch, newest first, with one
+    GraphQL query per 100 commits.
+
+    Only the fields of the commits table are requested.
+    """
+
+    cursor = None
+    while True:
+        history = graphql(repo, _HISTORY_QUERY,
+                          {'owner': repo.owner.login, 'name': repo.name,
+                           'branch': 'refs/heads/' + branch,
+                           'cursor': cursor}
+                          )['repository']['ref']['target']['history']
+        yield [{'sha': node['oid'],
+                'committer_date': parse_github_date(node['committedDate']),
+                'author_date': parse_github_date(node['authoredDate']),
+                'parents': [p['oid'] for p in node['parents']['nodes']]}
+               for node in history['nodes']]
+        if not history['pageInfo']['hasNextPage']:
+            return
+        cursor = history['pageInfo']['endCursor']
+
+
+def update_api_commits(repo, store, branch=None):
+    """Ingest the commits of a branch into a RepoStore, via the Github API.
+
+    branch defaults to the repo's default branch. The history is read from
+    the branch head back until all parents of the new commits are in the
+    store, so an unchanged branch costs one request. If the last ingested
+    head is not an ancestor of the new one (history was rewritten), all
+    commits are read again.
+    Return the number of new commits.
+    """
+
+    branch = branch or repo._rawData.get('default_branch') or 'master'
+    # shared with update_local_commits, both ingest the same commits
+    meta_key = 'commits_head:' + branch
+    last_sha = store.get_meta(meta_key)
+    if not last_sha:
+        store.clear_commits()
+    head = None
+    # parents of new commits, which are neither new nor stored
+    missing = set()
+    # stored parents of new commits, the last head must be one of them
+    boundary = set()
+    counter = 0
+    for page in iter_api_commit_pages(repo, branch):
+        if head is None:
+            head = page[0]['sha'] if page else None
+            if head == last_sha:
+                return 0
+        shas = {c['sha'] for c in page}
+        parents = {p for c in page for p in c['parents']}
+        known = store.known_commits(shas | parents)
+        new = [c for c in page if c['sha'] not in known]
+        counter += store.upsert_commits(new)
+        missing = (missing | parents) - shas - known
+        boundary |= parents & known
+        if not missing:
+            break
+    if last_sha and last_sha not in boundary:
+        print('History of ' + branch + ' was rewritten, reading all commits')
+        store.set_meta(meta_key, '')
+        return update_api_commits(repo, store, branch)
+    store.set_meta(meta_key, head)
+    return counter
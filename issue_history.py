@@ -0,0 +1,182 @@
+"""
+Append-only history of issue states, with point-in-time queries.
+
+Every recorded run only appends the issues whose state, labels or PR status
+changed since the previous run, as fixed-width binary records:
+
+    time (int64, UTC epoch seconds), number (int32), labels (int32),
+    state (uint8: open, closed, removed), kind (uint8: issue, PR, merged PR)
+
+Label sets are interned, records refer to them by index. The records are
+kept in a memory-mapped file <path>.bin, the label sets and the run index
+in <path>.json. Whenever more changes than issues were appended since the
+last keyframe, a run stores the full state instead (a keyframe). The state
+at any time is rebuilt from the last keyframe and the changes after it,
+without reading older records, while storage grows with the number of
+changes.
+
+Requires Python3
+"""
+
+import os
+import json
+import time
+import bisect
+import numpy as np
+import repo_store
+
+RECORD = np.dtype([('time', '<i8'), ('number', '<i4'), ('labels', '<i4'),
+                   ('state', 'u1'), ('kind', 'u1')])
+STATES = ('open', 'closed', 'removed')
+KINDS = ('issue', 'pr', 'merged_pr')
+
+
+def _kind(issue):
+    if not issue['is_pr']:
+        return 0
+    return 2 if issue.get('merged_at') else 1
+
+
+class IssueHistory(object):
+    """History of issue states, stored in files starting with path."""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._data_path = path + '.bin'
+        self._index_path = path + '.json'
+        try:
+            with open(self._index_path) as fp:
+                self._index = json.load(fp)
+        except FileNotFoundError:
+            self._index = {'label_sets': [], 'keyframes': [], 'runs': []}
+        self._label_ids = {tuple(s): i for i, s in
+                           enumerate(self._index['label_sets'])}
+        # records of an interrupted run are not in the index, drop them
+        if os.path.exists(self._data_path) and \
+                os.path.getsize(self._data_path) != self._size() * \
+                RECORD.itemsize:
+            with open(self._data_path, 'r+b') as fp:
+                fp.truncate(self._size() * RECORD.itemsize)
+
+    def _size(self):
+        """Return the number of valid records."""
+
+        return self._index['runs'][-1][1] if self._index['runs'] else 0
+
+    def _records(self):
+        if not self._size():
+            return np.zeros(0, dtype=RECORD)
+        return np.memmap(self._data_path, dtype=RECORD, mode='r',
+                         shape=(self._size(),))
+
+    def _label_id(self, labels):
+        key = tuple(sorted(labels))
+        if key not in self._label_ids:
+            self._label_ids[key] = len(self._index['label_sets'])
+            self._index['label_sets'].append(list(key))
+        return self._label_ids[key]
+
+    def _state(self, stop):
+        """Return the state after the first stop records.
+
+        That is the latest record per issue, sorted by number, without
+        removed issues.
+        """
+
+        start = 0
+        for keyframe_start, keyframe_stop in self._index['keyframes']:
+            if keyframe_stop <= stop:
+                start = keyframe_start
+        records = np.array(self._records()[start:stop])[::-1]
+        # np.unique returns the first, i.e. latest, index of each number
+        latest = records[np.unique(records['number'], return_index=True)[1]]
+        return latest[latest['state'] != STATES.index('removed')]
+
+    def times(self):
+        """Return the times of all recorded runs."""
+
+        return [repo_store.from_timestamp(t) for t, size in
+                self._index['runs']]
+
+    def record(self, issues, when=None):
+        """Record the current state of all issues.
+
+        issues are issue records of a RepoStore, when defaults to now.
+        Return the number of changed issues.
+        """
+
+        runs = self._index['runs']
+        when = repo_store.to_timestamp(when) if when else int(time.time())
+        if runs:
+            when = max(when, runs[-1][0])
+        current = self._state(self._size())
+        new = np.array(sorted((when, i['number'],
+                               self._label_id(i['labels']),
+                               STATES.index(i['state']), _kind(i))
+                              for i in issues), dtype=RECORD)
+
+        position = np.minimum(np.searchsorted(current['number'],
+                                              new['number']),
+                              max(len(current) - 1, 0))
+        unchanged = np.zeros(len(new), dtype=bool)
+        if len(current):
+            old = current[position]
+            unchanged = ((old['number'] == new['number']) &
+                         (old['labels'] == new['labels']) &
+                         (old['state'] == new['state']) &
+                         (old['kind'] == new['kind']))
+        removed = current[~np.isin(current['number'], new['number'])]
+        removed['time'] = when
+        removed['state'] = STATES.index('removed')
+        changes = np.concatenate((new[~unchanged], removed))
+
+        start = self._size()
+        since_keyframe = start - (self._index['keyframes'][-1][1]
+                                  if self._index['keyframes'] else 0)
+        if since_keyframe + len(changes) >= len(new):
+            # store the full state, so older records need not be read
+            records = new
+            self._index['keyframes'].append([start, start + len(new)])
+        else:
+            records = changes
+        with open(self._data_path, 'ab') as fp:
+            fp.write(records.tobytes())
+        runs.append([when, start + len(records)])
+        temp_path = self._index_path + '.tmp'
+        with open(temp_path, 'w') as fp:
+            json.dump(self._index, fp)
+        os.replace(temp_path, self._index_path)
+        return len(changes)
+
+    def state_at(self, when):
+        """Return the recorded state of all issues at a time.
+
+        Return a dict of number -> {'state', 'labels', 'kind'}, as recorded
+        by the last run at or before when.
+        """
+
+        run = bisect.bisect_right([t for t, size in self._index['runs']],
+                                  repo_store.to_timestamp(when))
+        if not run:
+            return {}
+        label_sets = self._index['label_sets']
+        return {int(r['number']): {'state': STATES[r['state']],
+                                   'labels': label_sets[r['labels']],
+                                   'kind': KINDS[r['kind']]}
+                for r in self._state(self._index['runs'][run - 1][1])}
+
+    def diff(self, begin, end):
+        """Return the issues whose state changed between two times.
+
+        Return a dict of number -> (state at begin, state at end), with None
+        for issues not recorded at that time.
+        """
+
+        old = self.state_at(begin)
+        new = self.state_at(end)
+        return {n: (old.get(n), new.get(n))
+                for n in sorted(set(old) | set(new))
+                if old.get(n) != new.get(n)}
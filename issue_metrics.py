@@ -0,0 +1,316 @@
+"""
+Issue statistics over arbitrary time windows.
+
+IssueStats keeps the issues in arrays sorted by creation and by closing
+date, with prefix sums, prefix maxima and a sparse table for range maxima.
+Each windowed query is answered with a few binary searches instead of a
+scan over all issues, so many windows can be evaluated cheaply. New or
+updated issues can be added at any time. The indexes are then rebuilt in
+full, once, on the next query, not updated in place.
+
+Dates are naive UTC datetimes, durations are returned as timedeltas.
+
+Requires Python3
+"""
+
+import datetime
+import numpy as np
+import issue_timeline
+
+# sorts after all real dates, for issues that are still open
+_NEVER = np.iinfo('int64').max
+
+
+def _seconds(dates):
+    """Return datetimes (or None) as int64 seconds, None as _NEVER."""
+
+    values = issue_timeline.to_datetime64(dates)
+    seconds = values.astype('int64')
+    seconds[np.isnat(values)] = _NEVER
+    return seconds
+
+
+def _to_datetime(seconds):
+    return datetime.datetime(1970, 1, 1) + datetime.timedelta(
+        seconds=int(seconds))
+
+
+def _bound(date, default):
+    """Return a window bound as seconds."""
+
+    if date is None:
+        return default
+    return int(np.datetime64(date, 's').astype('int64'))
+
+
+def _prefix_sum(values):
+    return np.concatenate(([0], np.cumsum(values)))
+
+
+class _RangeMax(object):
+    """Sparse table answering range argmax queries in constant time."""
+
+    def __init__(self, values):
+        self.values = values
+        self.table = [np.arange(len(values))]
+        width = 1
+        while 2 * width <= len(values):
+            prev = self.table[-1]
+            left, right = prev[:-width], prev[width:]
+            self.table.append(np.where(values[left] >= values[right],
+                                       left, right))
+            width *= 2
+
+    def argmax(self, start, stop):
+        """Return the index of the maximum in values[start:stop]."""
+
+        level = int(stop - start).bit_length() - 1
+        left = self.table[level][start]
+        right = self.table[level][stop - 2 ** level]
+        return left if self.values[left] >= self.values[right] else right
+
+
+class IssueStats(object):
+    """Windowed statistics of a set of issues.
+
+    issues are dicts with at least 'number', 'created_at' and 'closed_at'.
+    Optional keys are 'labels', 'comments' (a number) and 'updated_at'.
+    """
+
+    def __init__(self, issues=()):
+        self._issues = {}
+        self._dirty = True
+        self.update(issues)
+
+    def update(self, issues):
+        """Add new issues, or replace issues with the same number.
+
+        This only marks the indexes as outdated. The next query rebuilds
+        them from all issues, in O(n log n) for n issues, so any number of
+        updates between two queries costs one rebuild.
+        """
+
+        for i in issues:
+            self._issues[i['number']] = i
+            self._dirty = True
+
+    def __len__(self):
+        return len(self._issues)
+
+    def _index(self):
+        """Rebuild the sorted arrays and their prefix structures."""
+
+        if not self._dirty:
+            return
+        issues = list(self._issues.values())
+        numbers = np.array([i['number'] for i in issues], dtype='int64')
+        created = _seconds([i['created_at'] for i in issues])
+        closed = _seconds([i['closed_at'] for i in issues])
+        updated = _seconds([i.get('updated_at') or i['created_at']
+                            for i in issues])
+
+        # by creation date
+        order = np.argsort(created, kind='stable')
+        self._created = created[order]
+        self._created_numbers = numbers[order]
+        self._unlabeled = _prefix_sum(
+            [not issues[k].get('labels') for k in order])
+        self._uncommented = _prefix_sum(
+            [not issues[k].get('comments') for k in order])
+        # the first issue in creation order closed after a date is the
+        # oldest issue open at that date, see longest_open
+        self._closed_prefix_max = np.maximum.accumulate(closed[order])
+
+        # closed issues, by closing date
+        is_closed = closed != _NEVER
+        order = np.argsort(closed[is_closed], kind='stable')
+        self._closed = closed[is_closed][order]
+        self._closed_numbers = numbers[is_closed][order]
+        fix_times = (self._closed - created[is_closed][order]
+                     ).astype('float64')
+        self._fix_sum = _prefix_sum(fix_times)
+        # squares of the deviations from the overall mean, which keeps the
+        # prefix sums small enough for the differences to stay precise
+        self._fix_offset = fix_times.mean() if len(fix_times) else 0.0
+        self._fix_square_sum = _prefix_sum((fix_times -
+                                            self._fix_offset) ** 2)
+        self._fix_max = _RangeMax(fix_times)
+
+        # open issues, by last update
+        order = np.argsort(updated[~is_closed], kind='stable')
+        self._open_updated = updated[~is_closed][order]
+        self._open_updated_numbers = numbers[~is_closed][order]
+        self._dirty = False
+
+    def _created_range(self, begin, end):
+        """Return the index range of issues created in [begin, end)."""
+
+        self._index()
+        return (np.searchsorted(self._created, _bound(begin, -_NEVER)),
+                np.searchsorted(self._created, _bound(end, _NEVER)))
+
+    def _closed_range(self, begin, end):
+        """Return the index range of issues closed in [begin, end)."""
+
+        self._index()
+        return (np.searchsorted(self._closed, _bound(begin, -_NEVER)),
+                np.searchsorted(self._closed, _bound(end, _NEVER)))
+
+    def time_to_fix(self, begin=None, end=None):
+        """Return time-to-fix statistics of the issues closed in a window.
+
+        Return a dict with 'count', 'mean', 'std', 'max' and 'max_number',
+        the number of the slowest issue, or None if no issue was closed.
+        """
+
+        start, stop = self._closed_range(begin, end)
+        count = stop - start
+        if not count:
+            return None
+        total = self._fix_sum[stop] - self._fix_sum[start]
+        mean = total / count
+        variance = max((self._fix_square_sum[stop] -
+                        self._fix_square_sum[start]) / count -
+                       (mean - self._fix_offset) ** 2, 0)
+        slowest = self._fix_max.argmax(start, stop)
+        return {'count': int(count),
+                'mean': datetime.timedelta(seconds=mean),
+                'std': datetime.timedelta(seconds=variance ** 0.5),
+                'max': datetime.timedelta(
+                    seconds=self._fix_max.values[slowest]),
+                'max_number': int(self._closed_numbers[slowest])}
+
+    def longest_open(self, at):
+        """Return (number, age) of the oldest issue open at a date, or None."""
+
+        self._index()
+        t = _bound(at, None)
+        first = np.searchsorted(self._closed_prefix_max, t, side='right')
+        if first == len(self._created) or self._created[first] > t:
+            return None
+        return (int(self._created_numbers[first]),
+                datetime.timedelta(seconds=int(t - self._created[first])))
+
+    def longest_silent(self, now):
+        """Return (number, silence) of the least recently updated open issue.
+
+        Return None if no issue is open. Only the current state is known, so
+        now should be recent.
+        """
+
+        self._index()
+        if not len(self._open_updated):
+            return None
+        return (int(self._open_updated_numbers[0]),
+                datetime.timedelta(seconds=int(_bound(now, None) -
+                                               self._open_updated[0])))
+
+    def busiest_window(self, kind='created', width=datetime.timedelta(days=7),
+                       begin=None, end=None):
+        """Return the most issues created (or closed) within width.
+
+        Only windows starting with an issue's date in [begin, end) are
+        considered. Return (count, start date of the window), or (0, None).
+        """
+
+        self._index()
+        if kind == 'created':
+            dates = self._created
+            start, stop = self._created_range(begin, end)
+        elif kind == 'closed':
+            dates = self._closed
+            start, stop = self._closed_range(begin, end)
+        else:
+            raise ValueError('Unknown kind ' + str(kind))
+        if start == stop:
+            return (0, None)
+        window_starts = dates[start:stop]
+        # only issues dated before end are counted
+        counts = np.minimum(np.searchsorted(dates, window_starts +
+                                            int(width.total_seconds())),
+                            stop) - np.arange(start, stop)
+        best = np.argmax(counts)
+        return (int(counts[best]), _to_datetime(window_starts[best]))
+
+    def fraction_unlabeled(self, begin=None, end=None):
+        """Return the fraction of issues created in a window without labels.
+
+        Return None if no issue was created in the window.
+        """
+
+        start, stop = self._created_range(begin, end)
+        if start == stop:
+            return None
+        return float(self._unlabeled[stop] -
+                     self._unlabeled[start]) / (stop - start)
+
+    def fraction_uncommented(self, begin=None, end=None):
+        """Return the fraction of issues created in a window without comments.
+
+        Return None if no issue was created in the window.
+        """
+
+        start, stop = self._created_range(begin, end)
+        if start == stop:
+            return None
+        return float(self._uncommented[stop] -
+                     self._uncommented[start]) / (stop - start)
+
+    def summary(self, begin=None, end=None):
+        """Return a dict of all statistics for a window.
+
+        The longest silent issue is only included for windows up to now.
+        """
+
+        now = end or datetime.datetime.utcnow()
+        result = {'time_to_fix': self.time_to_fix(begin, end),
+                  'longest_open': self.longest_open(now),
+                  'most_created_7d': self.busiest_window('created',
+                                                         begin=begin,
+                                                         end=end),
+                  'most_closed_7d': self.busiest_window('closed',
+                                                        begin=begin, end=end),
+                  'unlabeled': self.fraction_unlabeled(begin, end),
+                  'uncommented': self.fraction_uncommented(begin, end)}
+        if end is None:
+            result['longest_silent'] = self.longest_silent(now)
+        return result
+
+
+def check_busiest_window(nr_issues=300, nr_windows=300, seed=0):
+    """Compare busiest_window to a brute-force count on random issues.
+
+    Raise an AssertionError on the first mismatch.
+    """
+
+    import random
+    rng = random.Random(seed)
+    origin = datetime.datetime(2010, 1, 1)
+
+    def date():
+        # days with several issues, to exercise ties
+        return origin + datetime.timedelta(days=rng.randrange(300),
+                                           hours=rng.choice([0, 12]))
+
+    issues = []
+    for number in range(nr_issues):
+        created = date()
+        closed = rng.choice([None, created + (date() - origin)])
+        issues.append({'number': number, 'created_at': created,
+                       'closed_at': closed})
+    stats = IssueStats(issues)
+    for _ in range(nr_windows):
+        kind = rng.choice(['created', 'closed'])
+        width = datetime.timedelta(days=rng.randrange(1, 30))
+        begin, end = sorted([date(), date()])
+        dates = sorted(i[kind + '_at'] for i in issues
+                       if i[kind + '_at'] is not None and
+                       begin <= i[kind + '_at'] < end)
+        expected = max([sum(1 for d in dates if s <= d < s + width)
+                        for s in dates] or [0])
+        count, start = stats.busiest_window(kind, width, begin, end)
+        assert count == expected, (kind, width, begin, end, count, expected)
+
+if __name__ == '__main__':
+    check_busiest_window()
+    print('busiest_window matches the brute-force count')
@@ -0,0 +1,157 @@
+"""
+Rendering of issue and commit statistics figures.
+
+A figure is described by a spec, a plain dict holding precomputed series
+(see issue_timeline.compute_timeline) and annotations, so figures can be
+rendered in worker processes. matplotlib is only imported when rendering.
+
+Kinds of figures:
+- 'overview': open/created/closed issues, and commits, in two panels
+- 'issues': open/created/closed issues only, e.g. for one label
+
+Requires Python3
+"""
+
+import os
+import json
+import pickle
+import hashlib
+
+MANIFEST_NAME = 'render_manifest.json'
+
+
+def pyplot(headless=True):
+    """Import and configure pyplot, with the Agg backend if headless."""
+
+    import matplotlib
+    if headless:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    matplotlib.rc('axes', grid=True, axisbelow=True)
+    matplotlib.rc('grid', linestyle='-', color='lightgray')
+    matplotlib.rc('figure', dpi=90)
+    return plt
+
+
+def annot_tags_events(axis, tag_list, events, event_titles):
+    """Add tag and event annotations to a given axis"""
+
+    import matplotlib.dates as mdates
+    for _t in tag_list:
+        axis.axvline(_t['date'], color='y', alpha=0.5)
+        # coordinates need to be converted to mpl internal format, see
+        # http://stackoverflow.com/a/11068038/599884
+        axis.annotate(_t['name'], xy=(mdates.date2num(_t['date']), 0.90),
+                      xycoords=("data", "axes fraction"), ha='right',
+                      va='top', annotation_clip=True)
+
+    for e in range(len(event_titles)):
+        axis.axvspan(events[e][0], events[e][1], color='y', alpha=0.5)
+        axis.annotate(event_titles[e],
+                      xy=(mdates.date2num(events[e][0]), 0.97),
+                      xycoords=("data", "axes fraction"), ha='right',
+                      va='top', annotation_clip=True)
+
+
+def _format_axis(axis, xlim):
+    import matplotlib.dates as mdates
+    locator = mdates.AutoDateLocator(maxticks=15)
+    axis.xaxis.set_major_locator(locator)
+    axis.xaxis.set_major_formatter(mdates.AutoDateFormatter(locator))
+    axis.xaxis.grid(False)
+    axis.set_xlim(*xlim)
+    axis.tick_params(axis='x', direction='out')
+
+
+def _plot_issues(axis, spec):
+    """Plot the open issue count and the created/closed histograms."""
+
+    import matplotlib.dates as mdates
+    timeline = spec['timeline']
+    edges = mdates.date2num(timeline['bin_edges'])
+    annot_tags_events(axis, spec['tags'], spec['events'],
+                      spec['event_titles'])
+    axis.plot(timeline['open_dates'], timeline['open_count'],
+              label='open issues', color='k', alpha=0.8)
+    # the histograms are precomputed, draw them as stacked steps
+    axis.stairs(timeline['created'], edges, fill=True,
+                label='created issues', color='red', alpha=0.8)
+    axis.stairs(timeline['created'] + timeline['closed'], edges,
+                baseline=timeline['created'], fill=True,
+                label='closed issues', color='green', alpha=0.8)
+    axis.legend(loc='center left')
+    _format_axis(axis, spec['xlim'])
+
+
+def _plot_commits(axis, spec):
+    """Plot the commit histogram."""
+
+    import matplotlib.dates as mdates
+    timeline = spec['timeline']
+    annot_tags_events(axis, spec['tags'], spec['events'],
+                      spec['event_titles'])
+    axis.stairs(timeline['commits'], mdates.date2num(timeline['bin_edges']),
+                fill=True, label=spec['commit_label'], color='blue',
+                alpha=0.5)
+    axis.legend(loc='center left')
+    _format_axis(axis, spec['xlim'])
+
+
+def plot_figure(spec, headless=True):
+    """Plot the figure described by spec, return it."""
+
+    plt = pyplot(headless)
+    if spec['kind'] == 'overview':
+        fig = plt.figure(figsize=(380/25.4, 200/25.4))
+        ax = fig.add_subplot(211)
+        ax.set_title(spec['title'])
+        _plot_issues(ax, spec)
+        ax2 = fig.add_subplot(212, sharex=ax)
+        ax2.set_title(spec['commit_title'])
+        _plot_commits(ax2, spec)
+    elif spec['kind'] == 'issues':
+        fig = plt.figure(figsize=(380/25.4, 100/25.4))
+        ax = fig.add_subplot(111)
+        ax.set_title(spec['title'])
+        _plot_issues(ax, spec)
+    else:
+        raise ValueError('Unknown figure kind ' + str(spec['kind']))
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    return fig
+
+
+def render(spec, outputs):
+    """Render a figure headless and save it to all outputs.
+
+    outputs is a list of (path, dpi) tuples, the file format is taken from
+    the file name. Return the list of written paths.
+    """
+
+    plt = pyplot()
+    fig = plot_figure(spec)
+    for path, dpi in outputs:
+        fig.savefig(path, dpi=dpi)
+    plt.close(fig)
+    return [path for path, dpi in outputs]
+
+
+def spec_hash(spec):
+    """Return a digest of a figure's input data."""
+
+    return hashlib.sha256(pickle.dumps(spec)).hexdigest()
+
+
+def load_manifest(directory):
+    """Return the dict of output file name -> input digest of a directory."""
+
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME)) as fp:
+            return json.load(fp)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(directory, manifest):
+    with open(os.path.join(directory, MANIFEST_NAME), 'w') as fp:
+        json.dump(manifest, fp, indent=1, sort_keys=True)
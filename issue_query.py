@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+"""Query the issues of a repository by state, labels, author and dates.
+
+Filters are combined, e.g. open issues without labels, created more than a
+year ago:
+    issue_query.py --state open --issues --no-label --created-before 365d
+Dates are given as YYYY-MM-DD or as a number of days ago, e.g. 365d.
+The local mirror is queried if it exists (see get_mirror), otherwise the
+filters are sent to the Github search API.
+"""
+
+import argparse
+import bisect
+import datetime
+import os
+import sys
+import github_tools
+import repo_store
+
+_DATE_FIELDS = ('created', 'updated', 'closed')
+# The search API only returns the first 1000 results of a query
+SEARCH_LIMIT = 1000
+
+
+class IssueIndex(object):
+    """Inverted indexes over a list of issue records of a RepoStore.
+
+    Every filter maps to a set of issue numbers, from a dict or a binary
+    search on the issues sorted by a date. Queries intersect these sets,
+    smallest first, instead of scanning all issues. Date ranges larger than
+    the smallest set are checked per remaining issue instead.
+    """
+
+    def __init__(self, issues):
+        self._issues = {}
+        self._by_state = {}
+        self._by_kind = {False: set(), True: set()}
+        self._by_label = {}
+        self._unlabeled = set()
+        self._by_author = {}
+        # per issue number, the timestamps of the date fields
+        self._timestamps = {}
+        dates = {f: [] for f in _DATE_FIELDS}
+        for i in issues:
+            number = i['number']
+            self._issues[number] = i
+            self._by_state.setdefault(i['state'], set()).add(number)
+            self._by_kind[bool(i['is_pr'])].add(number)
+            for l in i['labels']:
+                self._by_label.setdefault(l, set()).add(number)
+            if not i['labels']:
+                self._unlabeled.add(number)
+            self._by_author.setdefault(i['user'], set()).add(number)
+            timestamps = tuple(repo_store.to_timestamp(i[f + '_at'])
+                               for f in _DATE_FIELDS)
+            self._timestamps[number] = timestamps
+            for f, t in zip(_DATE_FIELDS, timestamps):
+                if t is not None:
+                    dates[f].append((t, number))
+        # per date field, the sorted timestamps and their issue numbers
+        self._dates = {}
+        for f, pairs in dates.items():
+            pairs.sort()
+            self._dates[f] = ([t for t, n in pairs], [n for t, n in pairs])
+
+    def __len__(self):
+        return len(self._issues)
+
+    def _date_range(self, field, low, high):
+        """Return the index range of issues with low <= timestamp < high.
+
+        The range is in the issues sorted by a date field. None bounds are
+        open.
+        """
+
+        times = self._dates[field][0]
+        start = 0 if low is None else bisect.bisect_left(times, low)
+        stop = len(times) if high is None else bisect.bisect_left(times,
+                                                                  high)
+        return start, stop
+
+    def query(self, state=None, is_pr=None, labels=(), no_label=False,
+              author=None, created_after=None, created_before=None,
+              updated_after=None, updated_before=None, closed_after=None,
+              closed_before=None):
+        """Return the issue records matching all given filters.
+
+        labels are required to all be present, with no_label only issues
+        without any label match. Date bounds are datetimes, the after bounds
+        inclusive. Records are ordered by number.
+        """
+
+        candidates = []
+        if state is not None:
+            candidates.append(self._by_state.get(state, set()))
+        if is_pr is not None:
+            candidates.append(self._by_kind[bool(is_pr)])
+        for l in labels:
+            candidates.append(self._by_label.get(l, set()))
+        if no_label:
+            candidates.append(self._unlabeled)
+        if author is not None:
+            candidates.append(self._by_author.get(author, set()))
+        bounds = {'created': (created_after, created_before),
+                  'updated': (updated_after, updated_before),
+                  'closed': (closed_after, closed_before)}
+        # (size, field index, low, high) of every date range
+        ranges = []
+        for k, f in enumerate(_DATE_FIELDS):
+            if bounds[f] != (None, None):
+                low, high = (repo_store.to_timestamp(d) for d in bounds[f])
+                start, stop = self._date_range(f, low, high)
+                ranges.append((stop - start, k, low, high))
+        ranges.sort(key=lambda r: r[0])
+        if ranges and (not candidates or
+                       ranges[0][0] < min(len(c) for c in candidates)):
+            # the most selective filter is a date range
+            size, k, low, high = ranges.pop(0)
+            start, stop = self._date_range(_DATE_FIELDS[k], low, high)
+            candidates.append(set(self._dates[_DATE_FIELDS[k]][1]
+                                  [start:stop]))
+        if not candidates:
+            numbers = self._issues.keys()
+        else:
+            candidates.sort(key=len)
+            numbers = candidates[0].intersection(*candidates[1:])
+        for size, k, low, high in ranges:
+            numbers = [n for n in numbers
+                       if self._timestamps[n][k] is not None and
+                       (low is None or self._timestamps[n][k] >= low) and
+                       (high is None or self._timestamps[n][k] < high)]
+        return [self._issues[n] for n in sorted(numbers)]
+
+
+def _search_date(date, round_up=False):
+    """Return a date for a search qualifier, which only has day resolution."""
+
+    day = date.date()
+    if round_up and date != datetime.datetime.combine(day, datetime.time()):
+        day += datetime.timedelta(days=1)
+    return day.isoformat()
+
+
+def search_query(full_name, state=None, is_pr=None, labels=(),
+                 no_label=False, author=None, **dates):
+    """Return a Github search query for the filters of IssueIndex.query.
+
+    The date qualifiers are widened to whole days, so the search results
+    are a superset of the matching issues.
+    """
+
+    terms = ['repo:' + full_name]
+    if state is not None:
+        terms.append('is:' + state)
+    if is_pr is not None:
+        terms.append('is:pr' if is_pr else 'is:issue')
+    terms.extend('label:"' + l + '"' for l in labels)
+    if no_label:
+        terms.append('no:label')
+    if author is not None:
+        terms.append('author:' + author)
+    for f in _DATE_FIELDS:
+        if dates.get(f + '_after') is not None:
+            terms.append(f + ':>=' + _search_date(dates[f + '_after']))
+        if dates.get(f + '_before') is not None:
+            terms.append(f + ':<' + _search_date(dates[f + '_before'],
+                                                 round_up=True))
+    return ' '.join(terms)
+
+
+def search(repo, **filters):
+    """Return the issue records matching the filters of IssueIndex.query,
+    asking the Github search API instead of a local mirror.
+
+    The search API returns at most SEARCH_LIMIT results, a warning is
+    printed if results are missing.
+    """
+
+    gh_instance = github_tools.get_github_instance()
+    results = gh_instance.search_issues(search_query(repo.full_name,
+                                                     **filters))
+    issues = github_tools.fetch_all(
+        results, max_pages=SEARCH_LIMIT // gh_instance.per_page,
+        per_page=gh_instance.per_page)
+    if results.totalCount > len(issues):
+        print('Warning: only ' + str(len(issues)) + ' of ' +
+              str(results.totalCount) + ' search results are available. '
+              'Narrow the filters, or sync a local mirror with get_mirror.')
+    # filter the superset of results exactly
+    return IssueIndex(repo_store.issue_record(i)
+                      for i in issues).query(**filters)
+
+
+def find_issues(user='openframeworks', repo='openFrameworks', offline=False,
+                **filters):
+    """Return the issue records of a repo matching the filters of
+    IssueIndex.query.
+
+    The local mirror is synced and queried if it exists, otherwise the
+    filters are sent to the Github search API.
+    """
+
+    if offline or github_tools.has_mirror(user, repo):
+        gh_repo, store = github_tools.get_mirror(user, repo, offline=offline)
+        return IssueIndex(store.issues()).query(**filters)
+    print('No local mirror of ' + user + '/' + repo + ', searching Github')
+    return search(github_tools.get_repo(user, repo), **filters)
+
+
+def parse_date(text):
+    """Parse a date given as YYYY-MM-DD, or as a number of days ago."""
+
+    if text.endswith('d'):
+        return datetime.datetime.utcnow() - datetime.timedelta(
+            days=int(text[:-1]))
+    return datetime.datetime.strptime(text, '%Y-%m-%d')
+
+
+def main(args):
+    """Main function of issue_query"""
+    parser = argparse.ArgumentParser(prog=os.path.basename(args[0]),
+                                     description=__doc__.split('\n\n')[0])
+    parser.add_argument('--state', choices=['open', 'closed'])
+    kind = parser.add_mutually_exclusive_group()
+    kind.add_argument('--issues', dest='is_pr', action='store_false',
+                      default=None, help='only issues, no PRs')
+    kind.add_argument('--prs', dest='is_pr', action='store_true',
+                      help='only PRs')
+    parser.add_argument('--label', dest='labels', action='append',
+                        default=[], help='required label, can be repeated')
+    parser.add_argument('--no-label', action='store_true',
+                        help='only issues without labels')
+    parser.add_argument('--author')
+    for f in _DATE_FIELDS:
+        for bound in ('after', 'before'):
+            parser.add_argument('--' + f + '-' + bound, type=parse_date,
+                                metavar='DATE')
+    parser.add_argument('--offline', action='store_true',
+                        help='query the local mirror without syncing it')
+    options = vars(parser.parse_args(args[1:]))
+    offline = options.pop('offline')
+
+    issues = find_issues(offline=offline, **options)
+    print('\n' + str(len(issues)) + ' matching issue(s):')
+    for i in issues:
+        print(str(i['number']) + '\t' + i['created_at'].date().isoformat() +
+              '\t' + ','.join(i['labels']) + '\t' + str(i['title']))
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,128 @@
+"""
+Vectorized computation of issue and commit timelines with NumPy.
+
+Dates are handled as datetime64[s] arrays (NaT for missing dates, e.g. the
+closing date of open issues), so series and histograms for any bin width
+are computed without Python loops.
+
+Requires Python3
+"""
+
+import numpy as np
+
+# The epoch was a Thursday, so day numbers with this remainder modulo 7 are
+# Mondays
+_MONDAY = 4
+_BIN_WIDTHS = {'D': 1, 'W': 7}
+
+
+def to_datetime64(dates):
+    """Convert a sequence of naive UTC datetimes (or None) to datetime64[s]."""
+
+    return np.array(dates, dtype='datetime64[s]')
+
+
+def bin_edges(begin, end, bin_width='W'):
+    """Return bin edges from begin to end, as datetime64[s] array.
+
+    bin_width is 'D' (days), 'W' (weeks, starting on Mondays), 'M' (calendar
+    months) or a numpy.timedelta64. The inner edges are aligned to the
+    calendar for the named widths. The first and last edges are always begin
+    and end.
+    """
+
+    begin = np.datetime64(begin, 's')
+    end = np.datetime64(end, 's')
+    if isinstance(bin_width, np.timedelta64):
+        inner = np.arange(begin + bin_width, end, bin_width)
+    elif bin_width == 'M':
+        inner = np.arange(begin.astype('datetime64[M]') + 1,
+                          end.astype('datetime64[M]') + 1)
+    elif bin_width in _BIN_WIDTHS:
+        first = begin.astype('datetime64[D]') + 1
+        if bin_width == 'W':
+            first += (_MONDAY - first.astype('int64')) % 7
+        inner = np.arange(first, end.astype('datetime64[D]') + 1,
+                          _BIN_WIDTHS[bin_width])
+    else:
+        raise ValueError('Unknown bin width ' + str(bin_width))
+    inner = inner.astype('datetime64[s]')
+    inner = inner[(inner > begin) & (inner < end)]
+    return np.concatenate(([begin], inner, [end]))
+
+
+def open_issue_series(created, closed):
+    """Return the dates of all status changes, and the open count after each.
+
+    created and closed are datetime64 arrays, with NaT for open issues.
+    """
+
+    closed = closed[~np.isnat(closed)]
+    dates = np.concatenate((created, closed))
+    steps = np.concatenate((np.ones(len(created), dtype='int64'),
+                            -np.ones(len(closed), dtype='int64')))
+    order = np.argsort(dates, kind='stable')
+    return dates[order], np.cumsum(steps[order])
+
+
+def histogram(dates, edges):
+    """Return the number of dates falling into each bin between edges."""
+
+    dates = dates[~np.isnat(dates)]
+    return np.histogram(dates.astype('int64'),
+                        bins=edges.astype('int64'))[0]
+
+
+def compute_timeline(created, closed, commit_dates=(), bin_width='W',
+                     begin=None, end=None):
+    """Return open issue counts and binned issue/commit statistics.
+
+    created and closed are sequences of the issues' creation and closing
+    dates (None for open issues), commit_dates the dates of commits. If not
+    given, begin is the earliest date and end the latest date found.
+
+    Return a dict with
+    - 'open_dates', 'open_count': the open issue count after each change
+    - 'bin_edges': datetime64[s] edges of the bins
+    - 'open_at_edges': the open issue count at each bin edge
+    - 'created', 'closed', 'commits': the counts per bin
+    """
+
+    created = to_datetime64(created)
+    closed = to_datetime64(closed)
+    commit_dates = to_datetime64(commit_dates)
+    open_dates, open_count = open_issue_series(created, closed)
+
+    all_dates = np.concatenate((open_dates, commit_dates))
+    all_dates = all_dates[~np.isnat(all_dates)]
+    if begin is None:
+        begin = all_dates.min()
+    if end is None:
+        end = all_dates.max()
+    edges = bin_edges(begin, end, bin_width)
+
+    # number of status changes up to and including each edge
+    nr_changes = np.searchsorted(open_dates, edges, side='right')
+    open_at_edges = np.concatenate(([0], open_count))[nr_changes]
+    return {'open_dates': open_dates,
+            'open_count': open_count,
+            'bin_edges': edges,
+            'open_at_edges': open_at_edges,
+            'created': histogram(created, edges),
+            'closed': histogram(closed, edges),
+            'commits': histogram(commit_dates, edges)}
+
+
+def clip_open_series(timeline):
+    """Return a timeline with the open issue series restricted to its bins.
+
+    The series starts with the open count at the first bin edge.
+    """
+
+    edges = timeline['bin_edges']
+    dates = timeline['open_dates']
+    inside = (dates > edges[0]) & (dates <= edges[-1])
+    return dict(timeline,
+                open_dates=np.concatenate(([edges[0]], dates[inside])),
+                open_count=np.concatenate(([timeline['open_at_edges'][0]],
+                                           timeline['open_count'][inside])))
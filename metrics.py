@@ -0,0 +1,211 @@
+"""
+Instrumentation of Github API usage, grouped by named phases.
+
+The connection layer in github_http reports every request here. Requests
+are counted (with cache hits and rate limit consumption per rate limit
+resource), along with transferred bytes and a latency histogram, under the
+phase active at the time:
+
+    with metrics.phase('issues'):
+        ...
+
+The active phase is kept in a context variable, so it is inherited by work
+submitted with in_context, e.g. to a thread pool. The collected numbers can
+be printed as summary, or exported as JSON or Prometheus text, e.g. at exit.
+
+Requires Python3
+"""
+
+import json
+import time
+import atexit
+import threading
+import contextlib
+import contextvars
+
+# upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+DEFAULT_PHASE = 'other'
+
+_current_phase = contextvars.ContextVar('phase', default=DEFAULT_PHASE)
+_lock = threading.Lock()
+_phases = {}
+_rate_limit_remaining = {}
+_export_paths = set()
+
+
+def _new_phase():
+    return {'duration': 0.0,
+            'calls': 0,
+            'requests': {},
+            'cache_hits': {},
+            'rate_limit_used': {},
+            'bytes_received': 0,
+            'bytes_sent': 0,
+            'latency_sum': 0.0,
+            'latency_buckets': [0] * len(LATENCY_BUCKETS)}
+
+
+def _increment(counts, key):
+    counts[key] = counts.get(key, 0) + 1
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Context manager attributing requests and elapsed time to a phase."""
+
+    token = _current_phase.set(name)
+    start = time.time()
+    try:
+        yield
+    finally:
+        duration = time.time() - start
+        _current_phase.reset(token)
+        with _lock:
+            p = _phases.setdefault(name, _new_phase())
+            p['duration'] += duration
+            p['calls'] += 1
+
+
+def in_context(function):
+    """Return a wrapper running function in the caller's current context.
+
+    Use it to keep the active phase for work submitted to a thread pool.
+    """
+
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # a context can only be entered by one thread at a time
+        return context.copy().run(function, *args, **kwargs)
+    return run
+
+
+def record_request(resource, status, bytes_sent, bytes_received, latency,
+                   headers=None):
+    """Record a finished request to the given rate limit resource."""
+
+    with _lock:
+        p = _phases.setdefault(_current_phase.get(), _new_phase())
+        _increment(p['requests'], resource)
+        if status == 304:
+            _increment(p['cache_hits'], resource)
+        elif headers and 'X-RateLimit-Remaining' in headers:
+            # conditional requests answered with 304 are free
+            _increment(p['rate_limit_used'], resource)
+        p['bytes_sent'] += bytes_sent
+        p['bytes_received'] += bytes_received
+        p['latency_sum'] += latency
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                p['latency_buckets'][i] += 1
+                break
+        if headers and 'X-RateLimit-Remaining' in headers:
+            _rate_limit_remaining[headers.get('X-RateLimit-Resource',
+                                              resource)] = \
+                int(headers['X-RateLimit-Remaining'])
+
+
+def snapshot():
+    """Return a JSON-serializable dict of all collected numbers."""
+
+    with _lock:
+        return {'latency_buckets': [str(b) for b in LATENCY_BUCKETS],
+                'rate_limit_remaining': dict(_rate_limit_remaining),
+                'phases': json.loads(json.dumps(_phases))}
+
+
+def reset():
+    """Forget all collected numbers."""
+
+    with _lock:
+        _phases.clear()
+        _rate_limit_remaining.clear()
+
+
+def to_prometheus(prefix='of_repo'):
+    """Return the collected numbers in the Prometheus text format."""
+
+    data = snapshot()
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append('# HELP ' + prefix + '_' + name + ' ' + help_text)
+        lines.append('# TYPE ' + prefix + '_' + name + ' ' + kind)
+        for suffix, labels, value in samples:
+            label_text = ','.join(k + '="' + str(v) + '"'
+                                  for k, v in labels)
+            lines.append(prefix + '_' + name + suffix + '{' + label_text +
+                         '} ' + repr(value))
+
+    phases = sorted(data['phases'].items())
+    metric('phase_duration_seconds', 'counter',
+           'Wall time spent in a phase.',
+           [('', [('phase', n)], p['duration']) for n, p in phases])
+    for key, help_text in (('requests', 'HTTP requests sent.'),
+                           ('cache_hits', 'Requests answered with 304 Not '
+                            'Modified from the response cache.'),
+                           ('rate_limit_used', 'Requests counted against '
+                            'the rate limit.')):
+        metric('http_' + key + '_total', 'counter', help_text,
+               [('', [('phase', n), ('resource', r)], count)
+                for n, p in phases for r, count in sorted(p[key].items())])
+    for key in ('bytes_received', 'bytes_sent'):
+        metric('http_' + key + '_total', 'counter',
+               'Bytes of HTTP request or response bodies.',
+               [('', [('phase', n)], p[key]) for n, p in phases])
+    samples = []
+    for n, p in phases:
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, p['latency_buckets']):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            samples.append(('_bucket', [('phase', n), ('le', le)],
+                            cumulative))
+        samples.append(('_sum', [('phase', n)], p['latency_sum']))
+        samples.append(('_count', [('phase', n)], cumulative))
+    metric('http_request_duration_seconds', 'histogram',
+           'Latency of HTTP requests.', samples)
+    metric('rate_limit_remaining', 'gauge',
+           'Last seen remaining rate limit.',
+           [('', [('resource', r)], v)
+            for r, v in sorted(data['rate_limit_remaining'].items())])
+    return '\n'.join(lines) + '\n'
+
+
+def write(path):
+    """Write the collected numbers to a file.
+
+    The format is Prometheus text if the file name ends with .prom, JSON
+    otherwise.
+    """
+
+    with open(path, 'w') as fp:
+        if path.endswith('.prom'):
+            fp.write(to_prometheus())
+        else:
+            json.dump(snapshot(), fp, indent=1)
+
+
+def export_at_exit(path):
+    """Write the collected numbers to path when the interpreter exits."""
+
+    if path not in _export_paths:
+        _export_paths.add(path)
+        atexit.register(write, path)
+
+
+def print_summary():
+    """Print a table of the collected numbers per phase."""
+
+    data = snapshot()
+    print('{:<12}{:>9}{:>10}{:>12}{:>12}{:>12}{:>14}'.format(
+        'Phase', 'Time [s]', 'Requests', 'Cache hits', 'Rate limit',
+        'Down [kB]', 'Latency [ms]'))
+    for name, p in sorted(data['phases'].items()):
+        nr_requests = sum(p['requests'].values())
+        latency = 1000 * p['latency_sum'] / nr_requests if nr_requests else 0
+        print('{:<12}{:>9.2f}{:>10}{:>12}{:>12}{:>12.1f}{:>14.0f}'.format(
+            name, p['duration'], nr_requests, sum(p['cache_hits'].values()),
+            sum(p['rate_limit_used'].values()), p['bytes_received'] / 1000,
+            latency))
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+"""Command line interface to the scripts of this collection.
+
+Usage: of-repo SUBCOMMAND [ARGUMENTS] [+ SUBCOMMAND [ARGUMENTS] ...]
+
+Subcommands chained with '+' run one after another in the same process,
+sharing one Github connection and synced local mirror.
+A subcommand's modules are only imported when it runs, so --help and shell
+completion respond without loading PyGithub, NumPy or Matplotlib.
+Run 'of-repo SUBCOMMAND --help' for details on a subcommand.
+Bash completion can be enabled with:
+    eval "$(of-repo --completion)"
+"""
+
+import os
+import sys
+
+# name -> (module, summary, if the module parses its own --help)
+SUBCOMMANDS = {
+    'closed-since-tag': ('get_closed_issues_since_tag',
+                         'list issues closed since a tag', False),
+    'merged-prs': ('get_merged_prs_since_tag',
+                   'list PRs merged since a tag, as markdown', False),
+    'unlabeled': ('get_issues_without_labels',
+                  'list open issues without labels', False),
+    'unmergeable': ('get_unmergeable_pr_percentage',
+                    'print the percentage of unmergeable PRs', False),
+    'org-members': ('get_org_members',
+                    'list the members of the organization teams', False),
+    'plot-stats': ('plot_issue_stats',
+                   'plot issue and commit statistics', True),
+    'query': ('issue_query',
+              'list issues by state, labels, author and dates', True),
+    'org-stats': ('get_org_stats',
+                  'print statistics of all repositories of an organization',
+                  True),
+}
+SEPARATOR = '+'
+
+# Completion is static, so no Python process is started on Tab
+BASH_COMPLETION = """_of_repo()
+{
+    local cur=${COMP_WORDS[COMP_CWORD]} prev=${COMP_WORDS[COMP_CWORD-1]}
+    if [ "$COMP_CWORD" -eq 1 ] || [ "$prev" = "%s" ]; then
+        COMPREPLY=($(compgen -W "%s" -- "$cur"))
+    else
+        COMPREPLY=($(compgen -W "%s --offline --help" -- "$cur"))
+    fi
+}
+complete -o default -F _of_repo of-repo
+"""
+
+
+def print_usage():
+    print(__doc__.split('\n\n')[1] + '\n')
+    print('Subcommands:')
+    for name, (module, summary, own_help) in sorted(SUBCOMMANDS.items()):
+        print('  {:<18}'.format(name) + summary)
+    print('\n' + __doc__.split('\n\n', 2)[2].rstrip())
+
+
+def print_subcommand_help(name):
+    """Print the docstring of a subcommand's module, without importing it."""
+
+    import ast
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        SUBCOMMANDS[name][0] + '.py')
+    with open(path) as fp:
+        print('Usage: of-repo ' + name + ' [ARGUMENTS]\n\n' +
+              ast.get_docstring(ast.parse(fp.read())))
+
+
+def split_commands(args):
+    """Split a command line into a list of (subcommand, arguments)."""
+
+    commands = []
+    current = []
+    for a in args + [SEPARATOR]:
+        if a != SEPARATOR:
+            current.append(a)
+        elif current:
+            commands.append((current[0], current[1:]))
+            current = []
+    return commands
+
+
+def main(args):
+    """Main function of of_repo"""
+    if len(args) < 2 or args[1] in ('-h', '--help'):
+        print_usage()
+        return
+    if args[1] == '--completion':
+        names = ' '.join(sorted(SUBCOMMANDS))
+        print(BASH_COMPLETION % (SEPARATOR, names, SEPARATOR), end='')
+        return
+    commands = split_commands(args[1:])
+    for name, arguments in commands:
+        if name not in SUBCOMMANDS:
+            sys.exit('Unknown subcommand ' + name + ', see of-repo --help')
+
+    import importlib
+    for name, arguments in commands:
+        module_name, summary, own_help = SUBCOMMANDS[name]
+        if not own_help and ('-h' in arguments or '--help' in arguments):
+            print_subcommand_help(name)
+            continue
+        if len(commands) > 1:
+            print('\n=== of-repo ' + name + ' ' + ' '.join(arguments))
+        module = importlib.import_module(module_name)
+        module.main(['of-repo ' + name] + arguments)
+
+if __name__ == '__main__':
+    main(sys.argv)
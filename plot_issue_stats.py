@@ -1,67 +1,279 @@
 #!/usr/bin/env python3
 """Main script for openFrameworks Github issues visualization."""
 
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
+import argparse
 import datetime
-import dateutil
 import pickle
 import github_tools
+import repo_store
+import issue_plots
+import metrics
 import os
 import sys
 from subprocess import check_output
+from collections import Counter
+from concurrent.futures import (ThreadPoolExecutor, ProcessPoolExecutor,
+                                as_completed)
 from operator import itemgetter
 
 # TODO:
-# possibly use a database instead of pickling: https://github.com/pudo/dataset
 # link plots
-# Calculate average, stddev, max of time-to-fix, open time.
-# other plots:
-# % issues without label
-# issue longest silent
-# longest open issue
-# most issues closed/opened per week/7day window
-# % without any comment
+# plots of the statistics computed by issue_metrics
 # most bugs squashed
 
 
-def naive_dt(aware_datetime):
-    """
-    Return a naive datetime.datetime object converted from a passed aware one.
+def run_stage(name, stage):
+    """Run a data acquisition stage as its own metrics phase."""
+
+    with metrics.phase(name):
+        return stage()
+
 
-    Enables comparison of aware datetimes from the local repo and the
-    naive ones coming from PyGithub.
+def get_issues(Repo, store, pickle_dir):
+    """Sync the issues into the store, return a processed issue list."""
+
+    print('Github shows ' + str(Repo.open_issues) + ' open issues and PRs.')
+    legacy_pickle_path = os.path.join(pickle_dir, 'Issues.pickle')
+    if store.issue_count() == 0 and os.path.isfile(legacy_pickle_path):
+        print('Converting issues from ' + legacy_pickle_path)
+        with open(legacy_pickle_path, 'rb') as fp:
+            store.upsert_issues(repo_store.issue_record(i)
+                                for i in pickle.load(fp).values())
+    if store.issue_count() > 0:
+        print('Loading issues from disk. Updating...')
+    else:
+        print('Fetching issues from Github')
+    _counter = github_tools.sync_issues(Repo, store)
+    print(str(_counter) + ' issue(s) updated')
+
+    issue_list = []
+    for i in store.issues():
+        _duration = (i['closed_at'] or datetime.datetime.now()) - \
+            i['created_at']
+        issue_list.append({'number': i['number'],
+                           'state': i['state'],
+                           'created_at': i['created_at'],
+                           'closed_at': i['closed_at'],
+                           'duration_open': _duration,
+                           'updated_at': i['updated_at'],
+                           'labels': i['labels'],
+                           'comments': i['comments'],
+                           'is_pr': i['is_pr']})
+    issue_list.sort(key=itemgetter('number'))
+    return issue_list
+
+
+def get_commits(Repo, store, repopath, target_branch):
+    """Return a list of commit dicts.
+
+    Commits are ingested into the store from a local repo if given, from
+    the Github API otherwise.
     """
 
-    return aware_datetime.astimezone(dateutil.tz.tzutc()).replace(tzinfo=None)
+    if repopath:
+        print('Getting commit data from local repository...')
+        # check for correct branch
+        if check_output(['git', 'symbolic-ref', '--short', 'HEAD'],
+                        cwd=repopath,
+                        universal_newlines=True).rstrip() != target_branch:
+            raise RuntimeError('Please check out the branch ' +
+                               target_branch + ' first.')
+        # check if up-to-date commit is checked out
+        current_sha = Repo.get_branch(target_branch).commit.sha
+        if check_output(['git', 'rev-parse', '--verify', 'HEAD'],
+                        cwd=repopath,
+                        universal_newlines=True).rstrip() != current_sha:
+            raise RuntimeError('Please sync with the remote repository. ' +
+                               'The current online commit is ' + current_sha)
+        # read new commits into the local store
+        _counter = github_tools.update_local_commits(store, repopath,
+                                                     target_branch)
+        print(str(_counter) + ' new commit(s)')
+        commits_list = store.commits()
+        _merges = sum(1 for c in commits_list if len(c['parents']) > 1)
+        print('%s commits on record, %s merges' % (len(commits_list), _merges))
+    else:
+        print('No local repository specified. Getting commits from Github')
+        # only commits added since the last run are fetched
+        _counter = github_tools.update_api_commits(Repo, store,
+                                                   target_branch)
+        print(str(_counter) + ' new commit(s)')
+        commits_list = store.commits()
+    return commits_list
+
+
+def overview_name(xend, name='OF'):
+    """Return the output name of the overview figure, see figure_specs."""
+
+    return name + '_repo_viz_' + str(xend.date())
 
 
-def annot_tags_events(axis, tag_list, events, event_titles):
-    """Add tag and event annotations to a given axis"""
+def figure_specs(figures, issue_list, commits_list, tags_list, xend,
+                 annotations, labels, target_branch, name='OF'):
+    """Return a dict of output name -> spec of the figures to render.
 
-    for _t in tag_list:
-        axis.axvline(_t['date'], color='y', alpha=0.5)
-        # coordinates need to be converted to mpl internal format, see
-        # http://stackoverflow.com/a/11068038/599884
-        axis.annotate(_t['name'], xy=(mdates.date2num(_t['date']), 0.90),
-                     xycoords=("data", "axes fraction"), ha='right', va='top')
+    figures is a list of 'overview', 'years' and 'labels'. name starts the
+    titles and output names. See issue_plots for the spec format.
+    """
 
-    for e in range(len(event_titles)):
-        axis.axvspan(events[e][0], events[e][1], color='y', alpha=0.5)
-        axis.annotate(event_titles[e], xy=(mdates.date2num(events[e][0]), 0.97),
-                     xycoords=("data", "axes fraction"), ha='right', va='top')
+    import issue_timeline
+    # end the last bin at midnight, so the figures only change with the data
+    # or the date
+    end = datetime.datetime.combine(xend.date(), datetime.time()) + \
+        datetime.timedelta(days=1)
+    created = [x['created_at'] for x in issue_list]
+    closed = [x['closed_at'] for x in issue_list]
+    commit_dates = [x['author_date'] for x in commits_list]
+    common = dict(annotations, tags=tags_list,
+                  commit_title=name + ' commit statistics',
+                  commit_label=target_branch + ' commits authored')
+    specs = {}
+    if 'overview' in figures:
+        timeline = issue_timeline.compute_timeline(created, closed,
+                                                   commit_dates,
+                                                   bin_width='W', end=end)
+        xbegin = timeline['bin_edges'][0].astype(datetime.datetime)
+        print("Data range: %s days" % str((xend-xbegin).days))
+        specs[overview_name(xend, name)] = dict(
+            common, kind='overview', timeline=timeline, xlim=(xbegin, None),
+            title=name + ' issue tracker statistics - created ' +
+            str(xend.date()))
+    if 'years' in figures:
+        for year in range(min(created).year, xend.year + 1):
+            begin = datetime.datetime(year, 1, 1)
+            timeline = issue_timeline.clip_open_series(
+                issue_timeline.compute_timeline(
+                    created, closed, commit_dates, bin_width='W',
+                    begin=begin, end=min(datetime.datetime(year + 1, 1, 1),
+                                         end)))
+            specs[name + '_repo_viz_' + str(year)] = dict(
+                common, kind='overview', timeline=timeline,
+                xlim=(begin, datetime.datetime(year + 1, 1, 1)),
+                title=name + ' issue tracker statistics - ' + str(year))
+    if 'labels' in figures:
+        for label in labels:
+            subset = [x for x in issue_list if label in x['labels']]
+            if not subset:
+                print('No issues labeled ' + label)
+                continue
+            timeline = issue_timeline.compute_timeline(
+                [x['created_at'] for x in subset],
+                [x['closed_at'] for x in subset], bin_width='M', end=end)
+            specs[name + '_repo_viz_label_' + label.replace('/', '_')] = dict(
+                common, kind='issues', timeline=timeline,
+                xlim=(timeline['bin_edges'][0].astype(datetime.datetime),
+                      None),
+                title=name + ' issues labeled "' + label + '"')
+    return specs
+
+
+def print_issue_statistics(issue_list, xend):
+    """Print issue statistics, for all time and the last year.
+
+    PRs are left out, like in get_org_stats.
+    """
 
+    import issue_metrics
+    stats = issue_metrics.IssueStats(i for i in issue_list if not i['is_pr'])
+    for title, begin in (('All time', None),
+                         ('Last 365 days',
+                          xend - datetime.timedelta(days=365))):
+        summary = stats.summary(begin)
+        print(title + ':')
+        fix = summary['time_to_fix']
+        if fix:
+            print('  Time to fix: average %s days, std. dev. %s days, '
+                  'max %s days (#%s)' % (fix['mean'].days, fix['std'].days,
+                                         fix['max'].days, fix['max_number']))
+        if summary['longest_open']:
+            print('  Longest open: #%s, %s days' %
+                  (summary['longest_open'][0],
+                   summary['longest_open'][1].days))
+        if summary['longest_silent']:
+            print('  Longest silent: #%s, %s days' %
+                  (summary['longest_silent'][0],
+                   summary['longest_silent'][1].days))
+        for kind in ('created', 'closed'):
+            count, start = summary['most_' + kind + '_7d']
+            if start:
+                print('  Most issues %s within 7 days: %s, from %s' %
+                      (kind, count, start.date()))
+        if summary['unlabeled'] is not None:
+            print('  Without label: %.1f%%, without comments: %.1f%%' %
+                  (100 * summary['unlabeled'], 100 * summary['uncommented']))
+
+
+def render_figures(specs, autosave_dir, formats, dpis, force=False,
+                   max_workers=None):
+    """Render figures in parallel worker processes, unless unchanged.
+
+    A manifest of the input data of each output file is kept, outputs whose
+    inputs did not change since the last render are skipped.
+    """
 
-def main():
+    os.makedirs(autosave_dir, exist_ok=True)
+    manifest = issue_plots.load_manifest(autosave_dir)
+    jobs = []
+    for name, spec in sorted(specs.items()):
+        digest = issue_plots.spec_hash(spec)
+        outputs = {}
+        for dpi in dpis:
+            for fmt in formats:
+                filename = name + ('_' + str(dpi) + 'dpi'
+                                   if len(dpis) > 1 else '') + '.' + fmt
+                key = digest + ':' + str(dpi)
+                if force or manifest.get(filename) != key or \
+                        not os.path.isfile(os.path.join(autosave_dir,
+                                                        filename)):
+                    outputs[filename] = (key, dpi)
+        if outputs:
+            jobs.append((spec, outputs))
+    nr_skipped = len(specs) - len(jobs)
+    if nr_skipped:
+        print(str(nr_skipped) + ' figure(s) unchanged, skipped')
+    if not jobs:
+        return
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(issue_plots.render, spec,
+                                   [(os.path.join(autosave_dir, f), dpi)
+                                    for f, (key, dpi) in outputs.items()])
+                   for spec, outputs in jobs]
+        for future, (spec, outputs) in zip(futures, jobs):
+            for path in future.result():
+                print('Saved ' + path)
+            manifest.update((f, key) for f, (key, dpi) in outputs.items())
+            issue_plots.save_manifest(autosave_dir, manifest)
+
+
+def main(args):
     """Main function for plot_issue_stats"""
+    parser = argparse.ArgumentParser(prog=os.path.basename(args[0]),
+                                     description=__doc__)
+    parser.add_argument('--headless', action='store_true',
+                        help='only save the figures, without showing them, '
+                        'e.g. for running from cron')
+    parser.add_argument('--figures', nargs='+', default=['overview'],
+                        choices=['overview', 'years', 'labels'],
+                        help='figures to render: the overview, one per year '
+                        'and/or one per label (default: overview)')
+    parser.add_argument('--labels', nargs='+',
+                        help='labels to render figures for (default: the '
+                        '8 most used)')
+    parser.add_argument('--format', nargs='+', default=['png'],
+                        choices=['png', 'svg'])
+    parser.add_argument('--dpi', nargs='+', type=int, default=[90],
+                        help='resolutions to render')
+    parser.add_argument('--workers', type=int,
+                        help='number of rendering processes (default: '
+                        'number of CPUs)')
+    parser.add_argument('--force', action='store_true',
+                        help='render figures even if their data did not '
+                        'change')
+    options = parser.parse_args(args[1:])
+
     ###########################################################################
     # CONFIGURATION
     target_branch = 'master'
-
-    mpl.rc('axes', grid=True, axisbelow=True)
-    mpl.rc('grid', linestyle='-', color='lightgray')
-    mpl.rc('figure', dpi=90)
     # -------------------------------------------------------------------------
     event_datefmt = "%Y-%m-%d"
     tmp = [['2008-09-04', '2008-09-09'],
@@ -80,196 +292,80 @@ def main():
     # Fetch needed data
     print('Fetching fresh data from Github')
     Repo = github_tools.get_repo()
-
-    ###########################################################################
-    print('\nGetting issues')
-    print('Github shows ' + str(Repo.open_issues) + ' open issues and PRs.')
-    github_tools.log_traffic()  # initial call to establish baseline
-    issues_path = os.path.join(pickle_dir, 'Issues.pickle')
-    if os.path.isfile(issues_path):
-        print('Loading issues from disk. Updating...')
-        with open(issues_path, 'rb') as fp:
-            Issues = pickle.load(fp)
-        last_update = max({v.updated_at for v in Issues.values()})
-        print('Last updated at ' + str(last_update) + ' UTC')
-        _issue_updates = Repo.get_issues(state='all', since=last_update)
-        _counter = 0
-        for i in _issue_updates:
-            _counter += 1
-            Issues[i.number] = i  # replace updated issues in local structure
-        print(str(_counter) + ' issue(s) updated')
-    else:
-        print('\nFetching issues from Github')
-        Issues = dict()  # holds the PyGithub issues, indexed by number
-        for i in Repo.get_issues(state='all'):
-            #  i.update()  # to fetch whole contents
-            # This takes one request per update(), and is very slow!
-            # (15+ min and 10-20kB/s)
-            # skipping this step takes 100 requests for 3000 issues and ca 2min
-            Issues[i.number] = i
-        print('Issues received')
-
-    print('Creating processed issue list')
-    issue_list = []
-    for i in Issues.values():
-        if i.closed_at:
-            _closed = i.closed_at
-        else:
-            _closed = None
-        _duration = (i.closed_at or datetime.datetime.now()) - i.created_at
-        issue_list.append({'number': i.number,
-                           'state': i.state,
-                           'created_at': i.created_at,
-                           'closed_at': _closed,
-                           'duration_open': _duration})
-    issue_list.sort(key=itemgetter('number'))
-    print('%s issues on record' % len(issue_list))
-
-    github_tools.log_traffic()
-
-    ###########################################################################
-    print('\nGetting tags')
-    Tags = Repo.get_tags()
-    print('Creating tags list')
-    tags_list = []
-    for t in Tags:
-        tags_list.append({'date': t.commit.commit.committer.date,
-                          'name': t.name})
-    github_tools.log_traffic()
-
-    ###########################################################################
-    print('\nGetting commits')
-    commits_list = []
-
+    store = repo_store.RepoStore(repo_store.default_path())
     repopath = github_tools.local_repo_location()
-    if repopath:
-        print('Getting commit data from local repository...')
-        # check for correct branch
-        if check_output(['git', 'symbolic-ref', '--short', 'HEAD'],
-                        cwd=repopath,
-                        universal_newlines=True).rstrip() != target_branch:
-            print('ERROR: Please check out the branch ' +
-                  target_branch + ' first.')
-            sys.exit(1)
-        # check if up-to-date commit is checked out
-        current_sha = Repo.get_branch(target_branch).commit.sha
-        if check_output(['git', 'rev-parse', '--verify', 'HEAD'],
-                        cwd=repopath,
-                        universal_newlines=True).rstrip() != current_sha:
-            print('ERROR: Please sync with the remote repository. ' +
-                  'The current online commit is ' + current_sha)
-            sys.exit(1)
-        # get commit list
-        _out = check_output(['git', '--no-pager', 'log', target_branch,
-                             '--pretty=format:"%h  %ci  %ai  %p"'],
-                            cwd=repopath,
-                            universal_newlines=True)
-        _outlist = [o.strip('"') for o in _out.split(sep='\n')]
-        for l in _outlist:
-            # split into sha, committer date, author date, parents
-            _temp = l.split(sep='  ')
-            _parse = dateutil.parser.parse
-            # TODO: add parents to data structure
-            commits_list.append({'sha': _temp[0],
-                                 'committer_date': naive_dt(_parse(_temp[1])),
-                                 'author_date': naive_dt(_parse(_temp[2]))})
-        print('%s commits on record' % len(commits_list))
-        print('Done')
-    else:
-        print('No local repository specified. Getting commits from Github')
-        Commits = Repo.get_commits()
-        for c in Commits:
-            commits_list.append({'sha': c.sha,
-                                 'committer_date': c.commit.committer.date,
-                                 'author_date': c.commit.author.date})
-        print('%s commits received' % len(commits_list))
-        github_tools.log_traffic()
+
+    # The data sources are independent, so they are fetched concurrently.
+    # Tags and commits are optional for the plot, issues are not.
+    print('\nGetting issues, tags and commits')
+    stages = {'issues': lambda: get_issues(Repo, store, pickle_dir),
+              'tags': lambda: github_tools.update_tag_index(Repo, store,
+                                                            repopath),
+              'commits': lambda: get_commits(Repo, store, repopath,
+                                             target_branch)}
+    data = {'tags': [], 'commits': []}
+    failed = []
+    with ThreadPoolExecutor(max_workers=len(stages)) as executor:
+        futures = {executor.submit(metrics.in_context(run_stage), name,
+                                   stage): name
+                   for name, stage in stages.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                data[name] = future.result()
+            except Exception as e:
+                print('ERROR while getting ' + name + ': ' + repr(e))
+                failed.append(name)
+                continue
+            print('Received ' + str(len(data[name])) + ' ' + name)
+            if name == 'issues':
+                # The issue statistics need neither tags nor commits, so
+                # they are processed while the other stages still run.
+                with metrics.phase('processing'):
+                    if 'labels' in options.figures and not options.labels:
+                        # the most used labels
+                        counts = Counter(l for x in data['issues']
+                                         for l in x['labels'])
+                        options.labels = [l for l, c in counts.most_common(8)]
+                    xend = datetime.datetime.utcnow()
+                    print_issue_statistics(data['issues'], xend)
+    if 'issues' in failed:
+        store.close()
+        sys.exit('Could not get issues, aborting.')
+    if failed:
+        print('Continuing without ' + ', '.join(failed))
+    issue_list = data['issues']
+    tags_list = data['tags']
+    commits_list = data['commits']
 
     ###########################################################################
     print('\nProcessing objects')
+    with metrics.phase('processing'):
+        specs = figure_specs(options.figures, issue_list, commits_list,
+                             tags_list, xend,
+                             {'events': OFEvents,
+                              'event_titles': OFEventTitles},
+                             options.labels, target_branch)
 
-    # one row of dates, one row of indices, +1 for opening, -1 for closing
-    open_issue_count = []
-    for i in issue_list:
-        open_issue_count.append({'date': i['created_at'],
-                                 'status_change': 1})
-        if i['closed_at']:
-            open_issue_count.append({'date': i['closed_at'],
-                                     'status_change': -1})
-    open_issue_count.sort(key=itemgetter('date'))
-    _sum = 0
-    for i in open_issue_count:
-        _sum += i['status_change']
-        i['open_issues'] = _sum
-
-    xbegin = min([min([x['author_date'] for x in commits_list]),
-                  min([x['date'] for x in open_issue_count])])
-    xend = datetime.datetime.utcnow()
-    print("Data range: %s days" % str((xend-xbegin).days))
-    bin_rrule = dateutil.rrule.rrule(dateutil.rrule.WEEKLY,
-                                     dtstart=xbegin,
-                                     byweekday=dateutil.rrule.MO)
-    bin_edges = mpl.dates.date2num([xbegin] +
-                                   bin_rrule.between(xbegin, xend, inc=False) +
-                                   [xend])
+    store.close()
 
     ###########################################################################
-    # Pickling of data structures
-    with open(issues_path, 'wb') as fp:
-        pickle.dump(Issues, fp)
-
-    ###########################################################################
-    print('Plotting figure')
-    fig = plt.figure(figsize=(380/25.4, 200/25.4))
-    ax = fig.add_subplot(211)
-    plt.title('OF issue tracker statistics - created ' + str(xend.date()))
-
-    annot_tags_events(ax, tags_list, OFEvents, OFEventTitles)
-    ax.plot([x['date'] for x in open_issue_count],
-            [x['open_issues'] for x in open_issue_count],
-            label='open issues', color='k', alpha=0.8)
-    _closed_issue_dates = [x['closed_at'] for x in issue_list
-                           if x['state'] == 'closed']
-    ax.hist([mpl.dates.date2num([x['created_at'] for x in issue_list]),
-             mpl.dates.date2num(_closed_issue_dates)],
-            histtype='barstacked',
-            bins=bin_edges,
-            label=['created issues', 'closed issues'],
-            color=['red', 'green'],
-            alpha=0.8)
-
-    ax.legend(loc='center left')
-    locator = mpl.dates.AutoDateLocator(maxticks=15)
-    ax.xaxis.set_major_locator(locator)
-    ax.xaxis.set_major_formatter(mpl.dates.AutoDateFormatter(locator))
-    ax.xaxis.grid(False)
-    ax.set_xlim(left=xbegin)
-    ax.tick_params(axis='x', direction='out')
-
-    # -------------------------------------------------------------------------
-    ax2 = fig.add_subplot(212, sharex=ax)
-    plt.title('OF commit statistics')
-    annot_tags_events(ax2, tags_list, OFEvents, OFEventTitles)
-    ax2.hist(mpl.dates.date2num([x['author_date'] for x in commits_list]),
-             bins=bin_edges,
-             label=(target_branch + ' commits authored'),
-             color='blue',
-             alpha=0.5)
-    ax2.legend(loc='center left')
-    ax2.xaxis.set_major_locator(locator)
-    ax2.xaxis.set_major_formatter(mpl.dates.AutoDateFormatter(locator))
-    ax2.xaxis.grid(False)
-    ax2.set_xlim(left=xbegin)
-    ax2.tick_params(axis='x', direction='out')
-
-    fig.autofmt_xdate()
-    plt.tight_layout()
-
-    plt.show()
-    fig.savefig(os.path.join(autosave_dir, 'OF_repo_viz_' + str(xend.date()) +
-                             '.png'))
+    print('Plotting figures')
+    with metrics.phase('plotting'):
+        render_figures(specs, autosave_dir, options.format, options.dpi,
+                       force=options.force, max_workers=options.workers)
+    print('')
+    metrics.print_summary()
+    if not options.headless and specs:
+        # the overview, or the first figure if it was not requested
+        shown = overview_name(xend)
+        if shown not in specs:
+            shown = sorted(specs)[0]
+        plt = issue_plots.pyplot(headless=False)
+        issue_plots.plot_figure(specs[shown], headless=False)
+        plt.show()
     print('\nFinished!')
     ###########################################################################
 
 if __name__ == '__main__':
-    main()
+    main(sys.argv)
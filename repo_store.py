@@ -0,0 +1,468 @@
+"""
+A compact on-disk store for Github repository data, backed by SQLite.
+
+Only the fields actually used by the scripts are kept, instead of whole
+pickled PyGithub objects. Timestamps are stored as UTC epoch seconds.
+
+Requires Python3
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import calendar
+import datetime
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS issues (
+    number INTEGER PRIMARY KEY,
+    state TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    closed_at INTEGER,
+    updated_at INTEGER NOT NULL,
+    is_pr INTEGER NOT NULL,
+    closed_by TEXT
+);
+CREATE INDEX IF NOT EXISTS issues_updated_at ON issues (updated_at);
+CREATE TABLE IF NOT EXISTS issue_labels (
+    number INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    PRIMARY KEY (number, label)
+);
+CREATE INDEX IF NOT EXISTS issue_labels_label ON issue_labels (label);
+CREATE TABLE IF NOT EXISTS labels (
+    name TEXT PRIMARY KEY,
+    color TEXT
+);
+CREATE TABLE IF NOT EXISTS commits (
+    sha TEXT PRIMARY KEY,
+    committer_date INTEGER NOT NULL,
+    author_date INTEGER NOT NULL,
+    parents TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tags (
+    name TEXT PRIMARY KEY,
+    sha TEXT,
+    date INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    login TEXT PRIMARY KEY,
+    name TEXT,
+    fetched_at INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Columns added to the issues table after its first version, added to
+# existing stores on opening
+_ADDED_ISSUE_COLUMNS = (('title', 'TEXT'),
+                        ('html_url', 'TEXT'),
+                        ('user', 'TEXT'),
+                        ('comments', 'INTEGER'),
+                        ('merged_at', 'INTEGER'),
+                        ('base_ref', 'TEXT'))
+
+_ISSUE_FIELDS = ('number', 'state', 'created_at', 'closed_at', 'updated_at',
+                 'is_pr', 'closed_by', 'title', 'html_url', 'user', 'comments',
+                 'merged_at')
+_DATE_FIELDS = ('created_at', 'closed_at', 'updated_at', 'merged_at')
+
+
+def default_path(user='openframeworks', repo='openFrameworks'):
+    """Return the default store location for a given repo.
+
+    If repo is None, return the location for data of the user/organization
+    itself.
+    """
+
+    currentdir = os.path.dirname(os.path.abspath(__file__))
+    name = user if repo is None else user + '_' + repo
+    return os.path.join(currentdir, 'issue_stats_pickles', name + '.sqlite')
+
+
+def to_timestamp(dt):
+    """Convert a (naive UTC or aware) datetime to epoch seconds."""
+
+    if dt is None:
+        return None
+    return calendar.timegm(naive_utc(dt).timetuple())
+
+
+def from_timestamp(ts):
+    """Convert epoch seconds to a naive UTC datetime, like PyGithub uses."""
+
+    if ts is None:
+        return None
+    return datetime.datetime.utcfromtimestamp(ts)
+
+
+def naive_utc(dt):
+    """Return a datetime as naive UTC.
+
+    PyGithub 2 returns aware datetimes, older versions naive UTC ones.
+    """
+
+    if dt is None or dt.tzinfo is None:
+        return dt
+    return dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def issue_record(issue):
+    """Extract the stored fields from a PyGithub Issue.
+
+    Care is taken not to touch lazily completed attributes, which would
+    trigger one extra API request per issue.
+    """
+
+    # closed_by is not part of the issue listing payload, and pull_request
+    # only for PRs. Look at the delivered data instead of letting PyGithub
+    # fetch the full issue when accessing them.
+    raw_data = getattr(issue, '_rawData', {})
+    raw_closed_by = raw_data.get('closed_by')
+    raw_pull_request = raw_data.get('pull_request')
+    # the merge date of PRs is delivered by newer API versions
+    merged_at = (raw_pull_request or {}).get('merged_at')
+    return {'number': issue.number,
+            'state': issue.state,
+            'created_at': naive_utc(issue.created_at),
+            'closed_at': naive_utc(issue.closed_at),
+            'updated_at': naive_utc(issue.updated_at),
+            'is_pr': raw_pull_request is not None,
+            'labels': [l.name for l in issue.labels],
+            'closed_by': raw_closed_by['login'] if raw_closed_by else None,
+            'title': issue.title,
+            'html_url': issue.html_url,
+            'user': issue.user.login if issue.user else None,
+            'comments': issue.comments,
+            'merged_at': (datetime.datetime.strptime(merged_at,
+                                                     '%Y-%m-%dT%H:%M:%SZ')
+                          if merged_at else None)}
+
+
+def pull_record(pull):
+    """Extract the PR specific stored fields from a PyGithub PullRequest."""
+
+    return {'number': pull.number,
+            'merged_at': naive_utc(pull.merged_at),
+            'base_ref': pull.base.ref}
+
+
+class RepoStore(object):
+    """SQLite-backed store of issue, commit, tag and user data."""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        # The connection may be shared between worker threads, serialize
+        # access to it.
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock:
+            self._db.executescript(_SCHEMA)
+            columns = {row['name'] for row in
+                       self._db.execute('PRAGMA table_info(issues)')}
+            for name, declaration in _ADDED_ISSUE_COLUMNS:
+                if name not in columns:
+                    self._db.execute('ALTER TABLE issues ADD COLUMN ' +
+                                     name + ' ' + declaration)
+
+    def close(self):
+        """Close the underlying database."""
+
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # -------------------------------------------------------------------------
+    def get_meta(self, key, default=None):
+        """Return a stored metadata value."""
+
+        with self._lock:
+            row = self._db.execute('SELECT value FROM meta WHERE key = ?',
+                                   (key,)).fetchone()
+        return row['value'] if row else default
+
+    def set_meta(self, key, value):
+        """Store a metadata value."""
+
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO meta (key, value) '
+                             'VALUES (?, ?)', (key, value))
+
+    # -------------------------------------------------------------------------
+    def issue_count(self):
+        """Return the number of stored issues."""
+
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM issues'
+                                    ).fetchone()[0]
+
+    def last_update(self):
+        """Return the newest updated_at of all issues, or None if empty.
+
+        Stores of earlier versions are synced from this mark on, see
+        github_tools.sync_issues.
+        """
+
+        with self._lock:
+            ts = self._db.execute('SELECT MAX(updated_at) FROM issues'
+                                  ).fetchone()[0]
+        return from_timestamp(ts)
+
+    def upsert_issues(self, records):
+        """Insert or replace issue records (dicts, see issue_record).
+
+        Return the number of records written.
+        """
+
+        rows = []
+        label_rows = []
+        for r in records:
+            rows.append(tuple(to_timestamp(r.get(f)) if f in _DATE_FIELDS
+                              else r.get(f) for f in _ISSUE_FIELDS))
+            label_rows.extend((r['number'], l) for l in r['labels'])
+        with self._lock, self._db:
+            # Keep a known closer if an update does not deliver it, unless the
+            # issue was closed again in the meantime. Same for the merge date.
+            self._db.executemany(
+                'INSERT INTO issues (' + ', '.join(_ISSUE_FIELDS) + ') '
+                'VALUES (' + ', '.join('?' * len(_ISSUE_FIELDS)) + ') '
+                'ON CONFLICT (number) DO UPDATE SET '
+                'state = excluded.state, created_at = excluded.created_at, '
+                'closed_at = excluded.closed_at, '
+                'updated_at = excluded.updated_at, is_pr = excluded.is_pr, '
+                'closed_by = CASE WHEN excluded.closed_at IS closed_at '
+                'THEN COALESCE(excluded.closed_by, closed_by) '
+                'ELSE excluded.closed_by END, '
+                'title = excluded.title, html_url = excluded.html_url, '
+                'user = excluded.user, comments = excluded.comments, '
+                'merged_at = COALESCE(excluded.merged_at, merged_at)', rows)
+            self._db.executemany('DELETE FROM issue_labels WHERE number = ?',
+                                 [(r[0],) for r in rows])
+            self._db.executemany('INSERT INTO issue_labels (number, label) '
+                                 'VALUES (?, ?)', label_rows)
+        return len(rows)
+
+    def update_pulls(self, records):
+        """Update the PR specific fields of stored issues (see pull_record).
+
+        Return the number of records written.
+        """
+
+        rows = [(to_timestamp(r['merged_at']), r['base_ref'], r['number'])
+                for r in records]
+        with self._lock, self._db:
+            self._db.executemany('UPDATE issues SET merged_at = ?, '
+                                 'base_ref = ? WHERE number = ?', rows)
+        return len(rows)
+
+    def set_closed_by(self, number, login):
+        """Store who closed an issue."""
+
+        with self._lock, self._db:
+            self._db.execute('UPDATE issues SET closed_by = ? '
+                             'WHERE number = ?', (login, number))
+
+    def issues(self, state=None, is_pr=None, closed_after=None,
+               merged_after=None):
+        """Return a list of stored issue records, ordered by number.
+
+        The records can be filtered by state ('open' or 'closed'), if they are
+        PRs, and by a minimal closing or merge date.
+        """
+
+        conditions = []
+        parameters = []
+        if state is not None:
+            conditions.append('state = ?')
+            parameters.append(state)
+        if is_pr is not None:
+            conditions.append('is_pr = ?')
+            parameters.append(int(is_pr))
+        if closed_after is not None:
+            conditions.append('closed_at > ?')
+            parameters.append(to_timestamp(closed_after))
+        if merged_after is not None:
+            conditions.append('merged_at > ?')
+            parameters.append(to_timestamp(merged_after))
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        with self._lock:
+            rows = self._db.execute('SELECT * FROM issues' + where +
+                                    ' ORDER BY number', parameters).fetchall()
+            labels = {}
+            for row in self._db.execute('SELECT number, label '
+                                        'FROM issue_labels'):
+                labels.setdefault(row['number'], []).append(row['label'])
+        return [{'number': row['number'],
+                 'state': row['state'],
+                 'created_at': from_timestamp(row['created_at']),
+                 'closed_at': from_timestamp(row['closed_at']),
+                 'updated_at': from_timestamp(row['updated_at']),
+                 'is_pr': bool(row['is_pr']),
+                 'labels': labels.get(row['number'], []),
+                 'closed_by': row['closed_by'],
+                 'title': row['title'],
+                 'html_url': row['html_url'],
+                 'user': row['user'],
+                 'comments': row['comments'],
+                 'merged_at': from_timestamp(row['merged_at']),
+                 'base_ref': row['base_ref']}
+                for row in rows]
+
+    # -------------------------------------------------------------------------
+    def replace_labels(self, records):
+        """Replace the stored repository labels (dicts with name and color)."""
+
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM labels')
+            self._db.executemany('INSERT INTO labels (name, color) '
+                                 'VALUES (?, ?)',
+                                 [(r['name'], r['color']) for r in records])
+
+    def labels(self):
+        """Return a list of the stored repository labels."""
+
+        with self._lock:
+            return [{'name': row['name'], 'color': row['color']}
+                    for row in self._db.execute('SELECT * FROM labels '
+                                                'ORDER BY name')]
+
+    # -------------------------------------------------------------------------
+    def upsert_commits(self, records):
+        """Insert or replace commit records.
+
+        Records are dicts with sha, committer_date, author_date and a list of
+        parent shas. Return the number of records written.
+        """
+
+        rows = [(r['sha'], to_timestamp(r['committer_date']),
+                 to_timestamp(r['author_date']), ' '.join(r['parents']))
+                for r in records]
+        with self._lock, self._db:
+            self._db.executemany('INSERT OR REPLACE INTO commits '
+                                 '(sha, committer_date, author_date, parents) '
+                                 'VALUES (?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def clear_commits(self):
+        """Remove all stored commits, e.g. after history was rewritten."""
+
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM commits')
+
+    def commits(self):
+        """Return a list of all stored commit records."""
+
+        with self._lock:
+            rows = self._db.execute('SELECT * FROM commits').fetchall()
+        return [{'sha': row['sha'],
+                 'committer_date': from_timestamp(row['committer_date']),
+                 'author_date': from_timestamp(row['author_date']),
+                 'parents': row['parents'].split()}
+                for row in rows]
+
+    def known_commits(self, shas):
+        """Return the set of the given shas which are in the store."""
+
+        shas = list(shas)
+        known = set()
+        with self._lock:
+            # stay below SQLite's limit of query parameters
+            for start in range(0, len(shas), 500):
+                batch = shas[start:start + 500]
+                known.update(row[0] for row in self._db.execute(
+                    'SELECT sha FROM commits WHERE sha IN (' +
+                    ', '.join('?' * len(batch)) + ')', batch))
+        return known
+
+    def first_parent_history(self, sha):
+        """Return the shas along the first-parent chain, starting at sha.
+
+        The chain ends at the first commit which is not in the store.
+        """
+
+        with self._lock:
+            parents = {row[0]: row[1].split()
+                       for row in self._db.execute('SELECT sha, parents '
+                                                   'FROM commits')}
+        history = []
+        while sha in parents:
+            history.append(sha)
+            sha = parents[sha][0] if parents[sha] else None
+        return history
+
+    # -------------------------------------------------------------------------
+    def upsert_tags(self, records):
+        """Insert or replace tag records (dicts with name, sha and date)."""
+
+        rows = [(r['name'], r['sha'], to_timestamp(r['date']))
+                for r in records]
+        with self._lock, self._db:
+            self._db.executemany('INSERT OR REPLACE INTO tags '
+                                 '(name, sha, date) '
+                                 'VALUES (?, ?, ?)', rows)
+        return len(rows)
+
+    def delete_tags(self, names):
+        """Delete the tags with the given names."""
+
+        with self._lock, self._db:
+            self._db.executemany('DELETE FROM tags WHERE name = ?',
+                                 [(n,) for n in names])
+
+    def tag_names(self):
+        """Return the set of stored tag names."""
+
+        with self._lock:
+            return {row[0] for row in self._db.execute('SELECT name '
+                                                       'FROM tags')}
+
+    def tags(self):
+        """Return a list of all stored tag records, oldest first."""
+
+        with self._lock:
+            rows = self._db.execute('SELECT * FROM tags ORDER BY date'
+                                    ).fetchall()
+        return [{'name': row['name'],
+                 'sha': row['sha'],
+                 'date': from_timestamp(row['date'])}
+                for row in rows]
+
+    # -------------------------------------------------------------------------
+    def upsert_users(self, records):
+        """Insert or replace user records (dicts with login and name)."""
+
+        now = int(time.time())
+        rows = [(r['login'], r['name'], now) for r in records]
+        with self._lock, self._db:
+            self._db.executemany('INSERT OR REPLACE INTO users '
+                                 '(login, name, fetched_at) VALUES (?, ?, ?)',
+                                 rows)
+        return len(rows)
+
+    def user_names(self, max_age=None):
+        """Return a dict of login -> name of the stored users.
+
+        If max_age (in seconds) is given, only users fetched more recently
+        are returned.
+        """
+
+        oldest = 0 if max_age is None else time.time() - max_age
+        with self._lock:
+            return {row[0]: row[1]
+                    for row in self._db.execute('SELECT login, name '
+                                                'FROM users '
+                                                'WHERE fetched_at >= ?',
+                                                (oldest,))}